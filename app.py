@@ -1,120 +1,220 @@
 import os
+import json
+import asyncio
+import base64
 import logging
-from typing import List, Any
+from typing import List, Any, Optional
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Request, Form, HTTPException, Depends
-from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Request, Form, HTTPException, Depends, File, UploadFile
+from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse, StreamingResponse, Response
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel, conint, conlist, validator
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, func, sql
-from sqlalchemy.orm import sessionmaker, Session, relationship, declarative_base
+from sqlalchemy import func, literal, literal_column, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 
+from logging_config import configure_logging
+from database import engine, read_engine, Manufacturer, Filament, Inventory, get_db, get_read_db
+from catalog_cache import CatalogCache, CATALOG, INVENTORY, bump_version, get_versions
+from stock import InsufficientStock, add_stock, consume_stock
+from ledger import LEDGER_COMPACT_INTERVAL, compact_periodically, consumption, has_pending, history, pending_quantities
+from occupancy import get_occupancy
+from search import search_filaments
+from colors import nearest_colors, parse_hex
+from events import PostgresListener, broadcaster
+from assets import AssetManifest, AssetStaticFiles
+from http_cache import CompressionMiddleware, check_not_modified, make_etag, with_etag
+from metrics import CONTENT_TYPE_LATEST, MetricsMiddleware, instrument_engine, mark_worker_dead, render_metrics
+from import_data import CHUNK_SIZE, ImportFormatError, import_catalog, export_inventory_csv, guess_format
+
 __version__ = "3.0"
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log"),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging (queued, rotated, structured; see logging_config.py)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
-#this is good now
-# Database setup
-DB_USER = os.getenv('DB_USER')
-DB_PASSWORD = os.getenv('DB_PASSWORD')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT', '5432')
-DB_DATABASE = os.getenv('DB_DATABASE')
-
-SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_DATABASE}"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
-# Define SQLAlchemy models
-class Manufacturer(Base):
-    __tablename__ = "manufacturer"
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(100), unique=True, index=True)
-
-class Filament(Base):
-    __tablename__ = "filament"
-    id = Column(Integer, primary_key=True, index=True)
-    manufacturer_id = Column(Integer, ForeignKey("manufacturer.id"))
-    type = Column(String)
-    color_name = Column(String)
-    color_hex_code = Column(String)
-
-class Inventory(Base):
-    __tablename__ = "inventory"
-    id = Column(Integer, primary_key=True, index=True)
-    filament_id = Column(Integer, ForeignKey("filament.id"))
-    location = Column(String)
-    quantity = Column(Integer)
-
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+
+CATALOG_CACHE_SIZE = int(os.getenv('CATALOG_CACHE_SIZE', '512'))
+catalog_cache = CatalogCache(maxsize=CATALOG_CACHE_SIZE)
+STOCK_BATCH_MAX = int(os.getenv('STOCK_BATCH_MAX', '1000'))
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Application is starting up")
-    Base.metadata.create_all(bind=engine)
-    logger.info("Database tables created")
+    # Fan stock events out across workers; without PostgreSQL they stay in-process
+    # LISTEN needs a session-mode connection, so behind PgBouncer point DB_LISTEN_URL at PostgreSQL itself
+    listener = PostgresListener(os.getenv('DB_LISTEN_URL') or engine.url) if engine.dialect.name == 'postgresql' else None
+    if listener:
+        listener.start()
+    # Fold the stock ledger into the inventory snapshot in the background (see ledger.py)
+    compactor = asyncio.create_task(compact_periodically(LEDGER_COMPACT_INTERVAL)) if LEDGER_COMPACT_INTERVAL > 0 else None
     yield
     # Shutdown
     logger.info("Application is shutting down")
+    if compactor:
+        compactor.cancel()
+    if listener:
+        await listener.stop()
+    await engine.dispose()
+    if read_engine:
+        await read_engine.dispose()
+    mark_worker_dead()
 
 app = FastAPI(lifespan=lifespan)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.add_middleware(MetricsMiddleware)
+# HTML, JSON and CSV only; /static is served precompressed
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv('COMPRESSION_MIN_SIZE', '1024')))
+instrument_engine(engine)
+if read_engine:
+    instrument_engine(read_engine, 'replica')
+asset_manifest = AssetManifest.load("static")
+app.mount("/static", AssetStaticFiles(directory="static", manifest=asset_manifest), name="static")
 templates = Jinja2Templates(directory="templates")
 
 def custom_url_for(name: str, **path_params: Any) -> str:
+    if name == 'static':
+        # Fingerprinted asset name
+        path_params['path'] = asset_manifest.resolve(path_params['path'])
     return app.url_path_for(name, **path_params)
 
 templates.env.globals["url_for"] = custom_url_for
 
+async def conditional(request: Request, db: AsyncSession, *names: str) -> tuple:
+    """ETag for a page built from the named data sets, and a 304 if the client already has it.
+
+    Costs one primary-key read of data_version, so handlers call it before
+    running their real queries.
+    """
+    versions = await get_versions(db, *names)
+    etag = make_etag(request, __version__, asset_manifest.version, *(versions[name] for name in names))
+    return etag, check_not_modified(request, etag)
+
+# Catalog lookups, served from catalog_cache until the catalog version changes
+async def get_manufacturers(db: AsyncSession) -> List[dict]:
+    async def load():
+        rows = (await db.execute(select(Manufacturer.id, Manufacturer.name).order_by(Manufacturer.name))).all()
+        return [{'id': id, 'name': name} for id, name in rows]
+    return await catalog_cache.get(db, ('manufacturers',), load)
+
+def types_query(manufacturer_id: int):
+    return select(Filament.type).filter(Filament.manufacturer_id == manufacturer_id).distinct().order_by(Filament.type)
+
+def colors_query(manufacturer_id: int, filament_type: str):
+    return select(Filament.id, Filament.color_name, Filament.color_hex_code).filter(
+        Filament.manufacturer_id == manufacturer_id,
+        Filament.type == filament_type
+    ).order_by(Filament.color_name)
+
+def filament_query(manufacturer_id: int, filament_type: str, color_name: str):
+    """The filament with this manufacturer, type and color name: the duplicate check before adding one."""
+    return select(Filament).filter(
+        Filament.manufacturer_id == manufacturer_id,
+        Filament.type == filament_type,
+        Filament.color_name == color_name
+    )
+
+async def get_types(db: AsyncSession, manufacturer_id: int) -> List[str]:
+    async def load():
+        return (await db.execute(types_query(manufacturer_id))).scalars().all()
+    return await catalog_cache.get(db, ('types', manufacturer_id), load)
+
+async def get_colors(db: AsyncSession, manufacturer_id: int, filament_type: str) -> List[tuple]:
+    async def load():
+        rows = (await db.execute(colors_query(manufacturer_id, filament_type))).all()
+        return [tuple(row) for row in rows]
+    return await catalog_cache.get(db, ('colors', manufacturer_id, filament_type), load)
+
+async def get_catalog_tree(db: AsyncSession, manufacturer_id: int) -> Optional[dict]:
+    """{'id', 'name', 'types': {type: [[filament_id, color_name, color_hex_code], ...]}}, or None."""
+    async def load():
+        rows = (await db.execute(
+            select(Manufacturer.name, Filament.id, Filament.type, Filament.color_name, Filament.color_hex_code)
+            .outerjoin(Filament, Filament.manufacturer_id == Manufacturer.id)
+            .where(Manufacturer.id == manufacturer_id)
+            .order_by(Filament.type, Filament.color_name)
+        )).all()
+        if not rows:
+            return None
+        types = {}
+        for _, filament_id, filament_type, color_name, color_hex_code in rows:
+            if filament_id is not None:
+                types.setdefault(filament_type, []).append([filament_id, color_name, color_hex_code])
+        return {'id': manufacturer_id, 'name': rows[0][0], 'types': types}
+    return await catalog_cache.get(db, ('catalog_tree', manufacturer_id), load)
+
+SHELVES = range(1, 9)
+SHELF_POSITIONS = ['LB', 'LF', 'RF', 'RB']
+SHELF_LOCATIONS = [f"{shelf}-{position}" for shelf in SHELVES for position in SHELF_POSITIONS]
+
+async def get_inventory_filters(db: AsyncSession) -> dict:
+    async def load():
+        types = (await db.execute(select(Filament.type).distinct().order_by(Filament.type))).scalars().all()
+        colors = (await db.execute(select(Filament.color_name).distinct().order_by(Filament.color_name))).scalars().all()
+        return {
+            'manufacturers': [m['name'] for m in await get_manufacturers(db)],
+            'types': types,
+            'colors': colors,
+            'locations': SHELF_LOCATIONS,
+        }
+    return await catalog_cache.get(db, ('inventory_filters',), load)
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "version": __version__}
 
+@app.get("/metrics")
+async def metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 @app.get("/select_manufacturer", response_class=HTMLResponse, name="select_manufacturer_get")
-async def select_manufacturer_get(request: Request, db: Session = Depends(get_db)):
+async def select_manufacturer_get(request: Request, db: AsyncSession = Depends(get_read_db)):
     try:
-        logger.info("Fetching manufacturers from database")
-        manufacturers = db.query(Manufacturer).order_by(Manufacturer.name).all()
-        manufacturers = [{'id': m.id, 'name': m.name} for m in manufacturers]
-        logger.info(f"Found {len(manufacturers)} manufacturers: {manufacturers}")
-        return templates.TemplateResponse("select_manufacturer.html", {"request": request, "manufacturers": manufacturers})
+        etag, not_modified = await conditional(request, db, CATALOG)
+        if not_modified:
+            return not_modified
+        manufacturers = await get_manufacturers(db)
+        logger.info(f"Found {len(manufacturers)} manufacturers")
+        return with_etag(templates.TemplateResponse("select_manufacturer.html", {"request": request, "manufacturers": manufacturers}), etag)
     except Exception as e:
         logger.error(f"Error fetching manufacturers: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching manufacturers: {str(e)}")
 
 @app.get('/select_filament/{manufacturer_id}')
-async def select_filament(request: Request, manufacturer_id: int, db: Session = Depends(get_db)):
-    logger.info(f"Fetching filament types for manufacturer_id: {manufacturer_id}")
-    types = db.query(Filament.type).filter(Filament.manufacturer_id == manufacturer_id).distinct().order_by(Filament.type).all()
-    types = [t[0] for t in types]
-    logger.info(f"Found filament types: {types}")
-    return templates.TemplateResponse('select_filament_type.html', {'request': request, 'manufacturer_id': manufacturer_id, 'types': types})
+async def select_filament(request: Request, manufacturer_id: int, db: AsyncSession = Depends(get_read_db)):
+    # Type, color and location are then picked client-side from /api/catalog/{manufacturer_id};
+    # the type buttons still post to select_filament_type_post without JavaScript
+    etag, not_modified = await conditional(request, db, CATALOG, INVENTORY)
+    if not_modified:
+        return not_modified
+    types = await get_types(db, manufacturer_id)
+    occupied_locations = await get_occupancy(db)
+    logger.info(f"Found {len(types)} filament types for manufacturer_id: {manufacturer_id}")
+    return with_etag(templates.TemplateResponse('select_filament_type.html', {
+        'request': request,
+        'manufacturer_id': manufacturer_id,
+        'types': types,
+        'occupied_locations': occupied_locations
+    }), etag)
+
+@app.get('/api/catalog/{manufacturer_id}', name="catalog_tree_api")
+async def catalog_tree_api(request: Request, manufacturer_id: int, db: AsyncSession = Depends(get_read_db)):
+    """A manufacturer's filaments as a type -> [[filament_id, color_name, color_hex_code]] tree."""
+    etag, not_modified = await conditional(request, db, CATALOG)
+    if not_modified:
+        return not_modified
+    tree = await get_catalog_tree(db, manufacturer_id)
+    if tree is None:
+        raise HTTPException(status_code=404, detail=f"Manufacturer {manufacturer_id} not found")
+    return with_etag(JSONResponse(content=tree), etag)
 
 @app.post('/select_filament_type/{manufacturer_id}')
 async def select_filament_type_post(request: Request, manufacturer_id: int, filament_type: str = Form(...)):
@@ -128,26 +228,25 @@ async def select_filament_type_post(request: Request, manufacturer_id: int, fila
         })
 
 @app.get('/select_color')
-async def select_color_get(request: Request, manufacturer_id: int, filament_type: str, db: Session = Depends(get_db)):
+async def select_color_get(request: Request, manufacturer_id: int, filament_type: str, db: AsyncSession = Depends(get_read_db)):
     try:
-        logger.info(f"Fetching colors for manufacturer_id: {manufacturer_id}, filament_type: {filament_type}")
-        colors = db.query(Filament.id, Filament.color_name, Filament.color_hex_code).filter(
-            Filament.manufacturer_id == manufacturer_id,
-            Filament.type == filament_type
-        ).order_by(Filament.color_name).all()
-        logger.info(f"Found colors: {colors}")
+        etag, not_modified = await conditional(request, db, CATALOG)
+        if not_modified:
+            return not_modified
+        colors = await get_colors(db, manufacturer_id, filament_type)
+        logger.info(f"Found {len(colors)} colors for manufacturer_id: {manufacturer_id}, filament_type: {filament_type}")
         if not colors:
             logger.warning(f'No colors found for {filament_type} from manufacturer ID {manufacturer_id}.')
             return templates.TemplateResponse('error.html', {
                 'request': request,
                 'error': f'No colors found for {filament_type} from manufacturer ID {manufacturer_id}.'
             })
-        return templates.TemplateResponse('select_color.html', {
+        return with_etag(templates.TemplateResponse('select_color.html', {
             'request': request,
             'manufacturer_id': manufacturer_id,
             'filament_type': filament_type,
             'colors': colors
-        })
+        }), etag)
     except Exception as e:
         logger.error(f"Error in select_color_get: {str(e)}")
         return templates.TemplateResponse('error.html', {
@@ -160,32 +259,86 @@ async def select_color_post(request: Request, manufacturer_id: int = Form(...),
     return RedirectResponse(url=f'/select_location/{filament_id}', status_code=303)
 
 @app.post('/select_location/{filament_id}', name="select_location_post")
-async def select_location_post(request: Request, filament_id: int, location: str = Form(...), quantity: int = Form(...), db: Session = Depends(get_db)):
+async def select_location_post(request: Request, filament_id: int, location: str = Form(...), quantity: int = Form(..., gt=0), db: AsyncSession = Depends(get_db)):
+    # Same rules as StockItem; a non-positive stock-in would bypass consume_stock's check
+    if location not in SHELF_LOCATIONS:
+        raise HTTPException(status_code=422, detail=f"Unknown shelf location {location!r}")
     try:
-        existing_item = db.query(Inventory).filter(Inventory.filament_id == filament_id, Inventory.location == location).first()
-        
-        if existing_item:
-            existing_item.quantity += quantity
-        else:
-            new_item = Inventory(filament_id=filament_id, location=location, quantity=quantity)
-            db.add(new_item)
-        
-        db.commit()
-        return RedirectResponse(url=app.url_path_for('select_manufacturer'), status_code=303)
+        await add_stock(db, [(filament_id, location, quantity)])
+        await db.commit()
+        return RedirectResponse(url=app.url_path_for('select_manufacturer_get'), status_code=303)
     except Exception as e:
         logger.error(f"Error in select_location: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error in select_location: {str(e)}")
 
+class StockItem(BaseModel):
+    filament_id: int
+    location: str
+    quantity: conint(gt=0) = 1
+
+    @validator('location')
+    def location_on_shelf(cls, location):
+        if location not in SHELF_LOCATIONS:
+            raise ValueError(f"unknown shelf location {location!r}")
+        return location
+
+class StockBatch(BaseModel):
+    items: conlist(StockItem, min_items=1, max_items=STOCK_BATCH_MAX)
+
+@app.post('/api/inventory/batch')
+async def inventory_batch_post(batch: StockBatch, db: AsyncSession = Depends(get_db)):
+    """Stock in many spools at once, e.g. a whole pallet, in a single statement."""
+    try:
+        rows = await add_stock(db, [(item.filament_id, item.location, item.quantity) for item in batch.items])
+        await db.commit()
+    except IntegrityError as ie:
+        await db.rollback()
+        logger.error(f"IntegrityError in inventory batch: {str(ie)}")
+        raise HTTPException(status_code=400, detail="Batch references an unknown filament.")
+    logger.info(f"Stocked {sum(row['quantity'] for row in rows)} spools into {len(rows)} inventory rows")
+    return JSONResponse(content={'rows': len(rows), 'spools': sum(row['quantity'] for row in rows)})
+
+@app.post('/api/inventory/consume')
+async def inventory_consume_post(batch: StockBatch, db: AsyncSession = Depends(get_db)):
+    """Take spools out of stock, e.g. when they are loaded into a printer."""
+    try:
+        rows = await consume_stock(db, [(item.filament_id, item.location, item.quantity) for item in batch.items])
+        await db.commit()
+    except InsufficientStock as e:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info(f"Consumed {-sum(row['quantity'] for row in rows)} spools from {len(rows)} inventory rows")
+    return JSONResponse(content={'rows': len(rows), 'spools': -sum(row['quantity'] for row in rows)})
+
+HISTORY_LIMIT_MAX = 500
+
+@app.get('/api/inventory/history/{filament_id}')
+async def inventory_history(request: Request, filament_id: int, limit: int = 100, db: AsyncSession = Depends(get_read_db)):
+    """Stock movements of one filament, newest first."""
+    limit = max(1, min(limit, HISTORY_LIMIT_MAX))
+    etag, not_modified = await conditional(request, db, INVENTORY)
+    if not_modified:
+        return not_modified
+    return with_etag(JSONResponse(content={'filament_id': filament_id, 'movements': await history(db, filament_id, limit)}), etag)
+
+@app.get('/api/reports/consumption')
+async def consumption_report(days: int = 30, limit: int = 20, db: AsyncSession = Depends(get_read_db)):
+    """Most used filaments over the last `days` days, with usage per day and days of stock left."""
+    days = max(1, min(days, 365))
+    limit = max(1, min(limit, 100))
+    return JSONResponse(content={'days': days, 'filaments': await consumption(db, days, limit)})
+
 @app.get('/select_location/{filament_id}', name="select_location_get")
-async def select_location_get(request: Request, filament_id: int, db: Session = Depends(get_db)):
+async def select_location_get(request: Request, filament_id: int, db: AsyncSession = Depends(get_read_db)):
     try:
-        occupied_locations = db.query(Inventory.location, func.sum(Inventory.quantity)).group_by(Inventory.location).all()
-        occupied_locations = {loc: qty for loc, qty in occupied_locations}
-        
-        filament = db.query(Filament).filter(Filament.id == filament_id).first()
+        etag, not_modified = await conditional(request, db, CATALOG, INVENTORY)
+        if not_modified:
+            return not_modified
+        occupied_locations = await get_occupancy(db)
+        filament = await db.get(Filament, filament_id)
         
         if filament:
-            return templates.TemplateResponse('select_location.html', {
+            return with_etag(templates.TemplateResponse('select_location.html', {
                 'request': request,
                 'filament_id': filament_id,
                 'manufacturer_id': filament.manufacturer_id,
@@ -193,69 +346,276 @@ async def select_location_get(request: Request, filament_id: int, db: Session =
                 'color_name': filament.color_name,
                 'color_hex_code': filament.color_hex_code,
                 'occupied_locations': occupied_locations
-            })
+            }), etag)
         else:
-            return RedirectResponse(url=app.url_path_for('select_manufacturer'), status_code=303)
+            return RedirectResponse(url=app.url_path_for('select_manufacturer_get'), status_code=303)
     except Exception as e:
         logger.error(f"Error in select_location: {str(e)}")
         return templates.TemplateResponse('error.html', {'request': request, 'error': f"Error in select_location: {str(e)}"})
 
+@app.get('/api/shelves')
+async def shelves_api(request: Request, db: AsyncSession = Depends(get_read_db)):
+    """Spools per shelf location, for every location in the grid."""
+    etag, not_modified = await conditional(request, db, INVENTORY)
+    if not_modified:
+        return not_modified
+    occupancy = await get_occupancy(db)
+    return with_etag(JSONResponse(content={
+        location: occupancy.get(location, 0) for location in SHELF_LOCATIONS
+    }), etag)
+
+SEARCH_LIMIT_MAX = 50
+
+@app.get('/api/search', name="search_api")
+async def search_api(request: Request, q: str = '', limit: int = 20, db: AsyncSession = Depends(get_read_db)):
+    """Ranked filaments matching every word of q, with their stock locations."""
+    limit = max(1, min(limit, SEARCH_LIMIT_MAX))
+    etag, not_modified = await conditional(request, db, CATALOG, INVENTORY)
+    if not_modified:
+        return not_modified
+    results = await search_filaments(db, q, limit)
+    return with_etag(JSONResponse(content={'query': q, 'results': results}), etag)
+
+NEAREST_COLORS_MAX = 50
+
+@app.get('/api/colors/nearest', name="nearest_colors_api")
+async def nearest_colors_api(request: Request, hex: str, k: int = 5, in_stock: bool = True,
+                             db: AsyncSession = Depends(get_read_db)):
+    """The k filaments closest in color to hex (CIELAB ΔE), with their stock locations."""
+    if parse_hex(hex) is None:
+        raise HTTPException(status_code=400, detail=f"Invalid hex color: {hex}")
+    k = max(1, min(k, NEAREST_COLORS_MAX))
+    etag, not_modified = await conditional(request, db, CATALOG, INVENTORY)
+    if not_modified:
+        return not_modified
+    results = await nearest_colors(db, hex, k, in_stock)
+    return with_etag(JSONResponse(content={'hex': hex, 'results': results}), etag)
+
+EVENTS_KEEPALIVE = int(os.getenv('EVENTS_KEEPALIVE', '15'))
+
+@app.get('/api/events', name="events_api")
+async def events_api():
+    """Server-Sent Events stream of stock changes (see events.py)."""
+    async def stream():
+        queue = broadcaster.subscribe()
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            broadcaster.unsubscribe(queue)
+    return StreamingResponse(stream(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.get('/view_inventory')
-async def view_inventory(request: Request, db: Session = Depends(get_db)):
-    inventory = db.query(
+async def view_inventory(request: Request, db: AsyncSession = Depends(get_read_db)):
+    # Rows are fetched page by page from /api/inventory; only the filter options are rendered here
+    etag, not_modified = await conditional(request, db, CATALOG)
+    if not_modified:
+        return not_modified
+    filters = await get_inventory_filters(db)
+    return with_etag(templates.TemplateResponse('view_inventory.html', {'request': request, 'filters': filters}), etag)
+
+def sort_text(column):
+    # Must match the expression indexes of migration 0008, so '' is inlined rather than bound
+    return func.coalesce(column, literal_column("''"))
+
+# Keyset per sort: the indexed text key, then ids to make it unique. NULLs sort as ''.
+INVENTORY_SORT_KEYS = {
+    'manufacturer': (sort_text(Manufacturer.name), Filament.id, Inventory.id),
+    'type': (sort_text(Filament.type), Filament.id, Inventory.id),
+    'color': (sort_text(Filament.color_name), Filament.id, Inventory.id),
+    'location': (sort_text(Inventory.location), Inventory.id),
+}
+INVENTORY_PAGE_MAX = 100
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str, sort: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(INVENTORY_SORT_KEYS[sort]):
+            raise ValueError(cursor)
+        return [str(values[0])] + [int(value) for value in values[1:]]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def inventory_page_query(sort: str = 'manufacturer', order: str = 'asc', after: Optional[list] = None,
+                         limit: int = 25, **filters: Optional[str]):
+    """Snapshot inventory rows in keyset order, after the `after` key; the ledger tail is added by the caller.
+
+    Rows whose snapshot quantity is 0 are kept only if they have pending
+    movements, which may still bring them above 0.
+    """
+    keys = INVENTORY_SORT_KEYS[sort]
+    query = select(
+        Inventory.id,
+        Inventory.filament_id,
         Manufacturer.name,
         Filament.type,
         Filament.color_name,
         Filament.color_hex_code,
         Inventory.location,
-        Inventory.quantity
+        Inventory.quantity,
+        *(key.label(f'sort_{i}') for i, key in enumerate(keys))
     ).join(Filament, Inventory.filament_id == Filament.id
     ).join(Manufacturer, Filament.manufacturer_id == Manufacturer.id
-    ).order_by(Manufacturer.name, Filament.type, Filament.color_name).all()
-
-    return templates.TemplateResponse('view_inventory.html', {'request': request, 'inventory': inventory})
+    ).where(or_(Inventory.quantity > 0, has_pending(Inventory.filament_id, Inventory.location)))
+
+    for name, column in (('manufacturer', Manufacturer.name), ('type', Filament.type),
+                         ('color', Filament.color_name), ('location', Inventory.location)):
+        if filters.get(name):
+            query = query.where(column == filters[name])
+    if after:
+        key, last_key = tuple_(*keys), tuple_(*(literal(value) for value in after))
+        query = query.where(key > last_key if order == 'asc' else key < last_key)
+    return query.order_by(*(key.asc() if order == 'asc' else key.desc() for key in keys)).limit(limit)
+
+@app.get('/api/inventory')
+async def inventory_api(
+    request: Request,
+    limit: int = 25,
+    sort: str = 'manufacturer',
+    order: str = 'asc',
+    cursor: Optional[str] = None,
+    manufacturer: Optional[str] = None,
+    type: Optional[str] = None,
+    color: Optional[str] = None,
+    location: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """One page of inventory, keyset-paginated on INVENTORY_SORT_KEYS."""
+    if sort not in INVENTORY_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by {sort}")
+    if order not in ('asc', 'desc'):
+        raise HTTPException(status_code=400, detail=f"Invalid order {order}")
+    limit = max(1, min(limit, INVENTORY_PAGE_MAX))
+    etag, not_modified = await conditional(request, db, CATALOG, INVENTORY)
+    if not_modified:
+        return not_modified
+
+    # Each round reads one index-ordered chunk of the snapshot and adds the ledger tail of
+    # just those rows; rows it empties are skipped, so another round may be needed
+    after = decode_cursor(cursor, sort) if cursor else None
+    filters = {'manufacturer': manufacturer, 'type': type, 'color': color, 'location': location}
+    rows = []
+    while len(rows) <= limit:
+        chunk = (await db.execute(inventory_page_query(sort, order, after, limit + 1, **filters))).all()
+        pending = await pending_quantities(db, [(row.filament_id, row.location) for row in chunk])
+        for row in chunk:
+            quantity = (row.quantity or 0) + pending.get((row.filament_id, row.location), 0)
+            if quantity > 0:
+                rows.append((row, quantity))
+        if len(chunk) <= limit:
+            break
+        after = [getattr(chunk[-1], f'sort_{i}') for i in range(len(INVENTORY_SORT_KEYS[sort]))]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        next_cursor = encode_cursor([getattr(last, f'sort_{i}') for i in range(len(INVENTORY_SORT_KEYS[sort]))])
+
+    return with_etag(JSONResponse(content={
+        'data': [
+            {
+                'id': row.id,
+                'manufacturer': row.name,
+                'type': row.type,
+                'color_name': row.color_name,
+                'color_hex_code': row.color_hex_code,
+                'location': row.location,
+                'quantity': quantity,
+            }
+            for row, quantity in rows
+        ],
+        'next_cursor': next_cursor,
+    }), etag)
+
+@app.get('/api/inventory/export.csv', name="inventory_export")
+async def inventory_export():
+    return StreamingResponse(
+        export_inventory_csv(),
+        media_type='text/csv',
+        headers={'Content-Disposition': 'attachment; filename="inventory.csv"'}
+    )
+
+@app.post('/api/catalog/import')
+async def catalog_import_post(file: UploadFile = File(...), format: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """Bulk import a CSV or NDJSON catalog file (see import_data.py for the columns)."""
+    async def chunks():
+        while chunk := await file.read(CHUNK_SIZE):
+            yield chunk
+
+    logger.info(f"Importing catalog file: {file.filename}")
+    try:
+        stats = await import_catalog(await db.connection(), chunks(), format or guess_format(file.filename))
+        await db.commit()
+    except ImportFormatError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error importing catalog file {file.filename}: {str(e)}")
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error importing catalog: {str(e)}")
+    logger.info(f"Catalog import finished: {stats}")
+    return JSONResponse(content=stats)
 
 @app.get('/data_maintenance')
 async def data_maintenance(request: Request):
     return templates.TemplateResponse('data_maintenance.html', {'request': request})
 
 @app.get('/manage_manufacturers', name="manage_manufacturers")
-async def manage_manufacturers_get(request: Request, db: Session = Depends(get_db)):
-    manufacturers = db.query(Manufacturer).order_by(Manufacturer.name).all()
-    return templates.TemplateResponse('manage_manufacturers.html', {'request': request, 'manufacturers': manufacturers, 'error': None})
+async def manage_manufacturers_get(request: Request, db: AsyncSession = Depends(get_db)):
+    etag, not_modified = await conditional(request, db, CATALOG)
+    if not_modified:
+        return not_modified
+    manufacturers = await get_manufacturers(db)
+    return with_etag(templates.TemplateResponse('manage_manufacturers.html', {'request': request, 'manufacturers': manufacturers, 'error': None}), etag)
 
 @app.post('/manage_manufacturers')
-async def manage_manufacturers_post(request: Request, manufacturer_name: str = Form(...), db: Session = Depends(get_db)):
+async def manage_manufacturers_post(request: Request, manufacturer_name: str = Form(...), db: AsyncSession = Depends(get_db)):
     logger.info(f"Attempting to add new manufacturer: {manufacturer_name}")
     try:
         new_manufacturer = Manufacturer(name=manufacturer_name)
         db.add(new_manufacturer)
-        db.commit()
+        await bump_version(db, CATALOG)
+        await db.commit()
         logger.info(f"Successfully added new manufacturer: {manufacturer_name}")
     except IntegrityError as ie:
         logger.error(f"IntegrityError while adding manufacturer {manufacturer_name}: {str(ie)}")
-        db.rollback()
+        await db.rollback()
         return templates.TemplateResponse('manage_manufacturers.html', {
             'request': request, 
-            'manufacturers': db.query(Manufacturer).order_by(Manufacturer.name).all(),
+            'manufacturers': await get_manufacturers(db),
             'error': 'A manufacturer with this name already exists.'
         })
     except Exception as e:
         logger.error(f"Unexpected error while adding manufacturer {manufacturer_name}: {str(e)}")
-        db.rollback()
+        await db.rollback()
         return templates.TemplateResponse('manage_manufacturers.html', {
             'request': request, 
-            'manufacturers': db.query(Manufacturer).order_by(Manufacturer.name).all(),
+            'manufacturers': await get_manufacturers(db),
             'error': f'An unexpected error occurred: {str(e)}'
         })
     
-    manufacturers = db.query(Manufacturer).order_by(Manufacturer.name).all()
+    manufacturers = await get_manufacturers(db)
     return templates.TemplateResponse('manage_manufacturers.html', {'request': request, 'manufacturers': manufacturers})
 
 @app.get('/manage_filaments', name="manage_filaments")
-async def manage_filaments_get(request: Request, db: Session = Depends(get_db)):
-    manufacturers = db.query(Manufacturer).order_by(Manufacturer.name).all()
-    return templates.TemplateResponse('manage_filaments.html', {'request': request, 'manufacturers': manufacturers})
+async def manage_filaments_get(request: Request, db: AsyncSession = Depends(get_db)):
+    etag, not_modified = await conditional(request, db, CATALOG)
+    if not_modified:
+        return not_modified
+    manufacturers = await get_manufacturers(db)
+    return with_etag(templates.TemplateResponse('manage_filaments.html', {'request': request, 'manufacturers': manufacturers}), etag)
 
 @app.post('/manage_filaments')
 async def manage_filaments_post(
@@ -264,15 +624,13 @@ async def manage_filaments_post(
     filament_type: str = Form(...),
     color_name: str = Form(...),
     color_hex_code: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     logger.info(f"Attempting to add new filament: manufacturer_id={manufacturer_id}, type={filament_type}, color_name={color_name}, color_hex_code={color_hex_code}")
     try:
-        existing_filament = db.query(Filament).filter(
-            Filament.manufacturer_id == manufacturer_id,
-            Filament.type == filament_type,
-            Filament.color_name == color_name
-        ).first()
+        existing_filament = (await db.execute(
+            filament_query(manufacturer_id, filament_type, color_name)
+        )).scalars().first()
 
         if not existing_filament:
             new_filament = Filament(
@@ -282,41 +640,47 @@ async def manage_filaments_post(
                 color_hex_code=color_hex_code
             )
             db.add(new_filament)
-            db.commit()
+            await bump_version(db, CATALOG)
+            await db.commit()
             logger.info(f"Successfully added new filament: manufacturer_id={manufacturer_id}, type={filament_type}, color_name={color_name}")
         else:
             logger.info(f"Filament already exists: manufacturer_id={manufacturer_id}, type={filament_type}, color_name={color_name}")
 
     except IntegrityError as ie:
         logger.error(f"IntegrityError while adding filament: {str(ie)}")
-        db.rollback()
+        await db.rollback()
         return templates.TemplateResponse('manage_filaments.html', {
             'request': request, 
-            'manufacturers': db.query(Manufacturer).order_by(Manufacturer.name).all(),
+            'manufacturers': await get_manufacturers(db),
             'error': 'An integrity error occurred while adding the filament.'
         })
     except Exception as e:
         logger.error(f"Unexpected error while adding filament: {str(e)}")
-        db.rollback()
+        await db.rollback()
         return templates.TemplateResponse('manage_filaments.html', {
             'request': request, 
-            'manufacturers': db.query(Manufacturer).order_by(Manufacturer.name).all(),
+            'manufacturers': await get_manufacturers(db),
             'error': f'An unexpected error occurred: {str(e)}'
         })
 
-    manufacturers = db.query(Manufacturer.id, Manufacturer.name).order_by(Manufacturer.name).all()
+    manufacturers = await get_manufacturers(db)
     return templates.TemplateResponse('manage_filaments.html', {'request': request, 'manufacturers': manufacturers})
 
 @app.get('/get_filament_types/{manufacturer_id}')
-async def get_filament_types(manufacturer_id: int, db: Session = Depends(get_db)):
-    filament_types = db.query(Filament.type).filter(Filament.manufacturer_id == manufacturer_id).distinct().order_by(Filament.type).all()
-    filament_types = [t[0] for t in filament_types]
-    return JSONResponse(content=filament_types)
+async def get_filament_types(request: Request, manufacturer_id: int, db: AsyncSession = Depends(get_read_db)):
+    etag, not_modified = await conditional(request, db, CATALOG)
+    if not_modified:
+        return not_modified
+    filament_types = await get_types(db, manufacturer_id)
+    return with_etag(JSONResponse(content=filament_types), etag)
 
 @app.get('/manage_colors', name="manage_colors")
-async def manage_colors_get(request: Request, db: Session = Depends(get_db)):
-    manufacturers = db.query(Manufacturer).order_by(Manufacturer.name).all()
-    return templates.TemplateResponse('manage_colors.html', {'request': request, 'manufacturers': manufacturers})
+async def manage_colors_get(request: Request, db: AsyncSession = Depends(get_db)):
+    etag, not_modified = await conditional(request, db, CATALOG)
+    if not_modified:
+        return not_modified
+    manufacturers = await get_manufacturers(db)
+    return with_etag(templates.TemplateResponse('manage_colors.html', {'request': request, 'manufacturers': manufacturers}), etag)
 
 @app.post('/manage_colors')
 async def manage_colors_post(
@@ -325,15 +689,13 @@ async def manage_colors_post(
     filament_type: str = Form(...),
     color_name: str = Form(...),
     color_hex_code: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     logger.info(f"Attempting to add new color: manufacturer_id={manufacturer_id}, type={filament_type}, color_name={color_name}, color_hex_code={color_hex_code}")
     try:
-        existing_filament = db.query(Filament).filter(
-            Filament.manufacturer_id == manufacturer_id,
-            Filament.type == filament_type,
-            Filament.color_name == color_name
-        ).first()
+        existing_filament = (await db.execute(
+            filament_query(manufacturer_id, filament_type, color_name)
+        )).scalars().first()
 
         if not existing_filament:
             new_filament = Filament(
@@ -343,29 +705,30 @@ async def manage_colors_post(
                 color_hex_code=color_hex_code
             )
             db.add(new_filament)
-            db.commit()
+            await bump_version(db, CATALOG)
+            await db.commit()
             logger.info(f"Successfully added new color: manufacturer_id={manufacturer_id}, type={filament_type}, color_name={color_name}")
         else:
             logger.info(f"Color already exists: manufacturer_id={manufacturer_id}, type={filament_type}, color_name={color_name}")
 
     except IntegrityError as ie:
         logger.error(f"IntegrityError while adding color: {str(ie)}")
-        db.rollback()
+        await db.rollback()
         return templates.TemplateResponse('manage_colors.html', {
             'request': request, 
-            'manufacturers': db.query(Manufacturer).order_by(Manufacturer.name).all(),
+            'manufacturers': await get_manufacturers(db),
             'error': 'An integrity error occurred while adding the color.'
         })
     except Exception as e:
         logger.error(f"Unexpected error while adding color: {str(e)}")
-        db.rollback()
+        await db.rollback()
         return templates.TemplateResponse('manage_colors.html', {
             'request': request, 
-            'manufacturers': db.query(Manufacturer).order_by(Manufacturer.name).all(),
+            'manufacturers': await get_manufacturers(db),
             'error': f'An unexpected error occurred: {str(e)}'
         })
 
-    manufacturers = db.query(Manufacturer).order_by(Manufacturer.name).all()
+    manufacturers = await get_manufacturers(db)
     return templates.TemplateResponse('manage_colors.html', {'request': request, 'manufacturers': manufacturers})
 
 @app.get("/version")
@@ -0,0 +1,181 @@
+"""Fingerprinted, precompressed static assets.
+
+`python assets.py` (run in the Docker build, or automatically on startup
+when the manifest is missing or out of date) writes, for every file in
+static/:
+
+- static/build/<name>.<hash>.<ext>, a copy named after its content hash
+- .gz and, when the Brotli package is installed, .br variants of text-like
+  files (CSS, JS, SVG, ICO, ...)
+- static/build/manifest.json, which maps logical names to the files above
+  and records the modification time of every source file
+
+The manifest is rebuilt at startup when a file in static/ was added,
+removed or modified since it was written, so edits outside the Docker
+build show up after a restart.
+
+Templates call url_for('static', path='style.css'), which resolves to the
+hashed name. AssetStaticFiles serves hashed files with
+`Cache-Control: immutable` and picks the best precompressed variant for
+the request's Accept-Encoding. Anything else under /static is served as
+before but must be revalidated.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from mimetypes import guess_type
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+STATIC_DIR = 'static'
+BUILD_DIR = 'build'
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.ico', '.json', '.txt', '.html', '.xml', '.map'}
+# Preferred first
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def publish(tmp_path: str, path: str) -> None:
+    """Rename a finished temp file into place, so concurrent builds never expose partial files."""
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    if os.path.exists(path):
+        return
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    publish(tmp_path, path)
+
+
+def sources(static_dir: str = STATIC_DIR):
+    """(path, logical name) of every file in static_dir outside the build directory."""
+    build_dir = os.path.join(static_dir, BUILD_DIR)
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != build_dir)
+        for filename in sorted(files):
+            source = os.path.join(root, filename)
+            yield source, os.path.relpath(source, static_dir).replace(os.sep, '/')
+
+
+def source_mtimes(static_dir: str = STATIC_DIR) -> Dict[str, int]:
+    return {logical: os.stat(source).st_mtime_ns for source, logical in sources(static_dir)}
+
+
+def build_assets(static_dir: str = STATIC_DIR) -> dict:
+    """Fingerprint and precompress everything in static_dir; returns the manifest."""
+    build_dir = os.path.join(static_dir, BUILD_DIR)
+    os.makedirs(build_dir, exist_ok=True)
+    manifest = {'assets': {}, 'encodings': {}, 'sources': {}}
+
+    for source, logical in sources(static_dir):
+        manifest['sources'][logical] = os.stat(source).st_mtime_ns
+        with open(source, 'rb') as f:
+            data = f.read()
+
+        base, ext = os.path.splitext(logical.replace('/', '_'))
+        hashed = f"{BUILD_DIR}/{base}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}"
+        target = os.path.join(static_dir, hashed)
+        write_atomic(target, data)
+        manifest['assets'][logical] = hashed
+
+        if ext.lower() in COMPRESSIBLE_EXTENSIONS:
+            encodings = []
+            if brotli is not None:
+                write_atomic(target + ENCODING_SUFFIXES['br'], brotli.compress(data, quality=11))
+                encodings.append('br')
+            write_atomic(target + ENCODING_SUFFIXES['gzip'], gzip.compress(data, compresslevel=9, mtime=0))
+            encodings.append('gzip')
+            manifest['encodings'][hashed] = encodings
+
+    fd, tmp_path = tempfile.mkstemp(dir=build_dir)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    publish(tmp_path, os.path.join(build_dir, MANIFEST_NAME))
+    return manifest
+
+
+class AssetManifest:
+    """Resolves logical static paths to their fingerprinted build outputs."""
+
+    def __init__(self, data: Optional[dict] = None):
+        data = data or {}
+        self.assets: Dict[str, str] = data.get('assets', {})
+        self.encodings: Dict[str, List[str]] = data.get('encodings', {})
+        self.version = hashlib.sha256(json.dumps(self.assets, sort_keys=True).encode()).hexdigest()[:HASH_LENGTH]
+
+    @classmethod
+    def load(cls, static_dir: str = STATIC_DIR, build: bool = True) -> 'AssetManifest':
+        """The manifest in static_dir; with build, (re)built first if missing or out of date."""
+        path = os.path.join(static_dir, BUILD_DIR, MANIFEST_NAME)
+        data = None
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+        if build and (data is None or data.get('sources') != source_mtimes(static_dir)):
+            data = build_assets(static_dir)
+        return cls(data)
+
+    def resolve(self, path: str) -> str:
+        """Hashed path for `path`, or `path` itself if it is not in the manifest."""
+        return self.assets.get(path, path)
+
+
+def accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        if name and params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class AssetStaticFiles(StaticFiles):
+    """StaticFiles that serves fingerprinted files precompressed and immutable."""
+
+    def __init__(self, *, manifest: AssetManifest, **kwargs):
+        super().__init__(**kwargs)
+        self.manifest = manifest
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        relative = os.path.relpath(full_path, os.path.realpath(self.directory)).replace(os.sep, '/')
+        if not relative.startswith(BUILD_DIR + '/'):
+            response = super().file_response(full_path, stat_result, scope, status_code)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+        accepted = accepted_encodings(Headers(scope=scope).get('accept-encoding', ''))
+        for encoding in self.manifest.encodings.get(relative, []):
+            if encoding in accepted:
+                response = FileResponse(
+                    full_path + ENCODING_SUFFIXES[encoding],
+                    status_code=status_code,
+                    media_type=guess_type(full_path)[0] or 'application/octet-stream',
+                    method=scope['method'],
+                )
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, method=scope['method'])
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+
+if __name__ == '__main__':
+    result = build_assets()
+    print(f"Built {len(result['assets'])} assets into {os.path.join(STATIC_DIR, BUILD_DIR)}")
@@ -0,0 +1,62 @@
+"""Compare two benchmark result files.
+
+    python benchmarks/compare.py benchmarks/results/baseline.json benchmarks/results/candidate.json
+
+Prints the change per endpoint and exits with status 1 when any endpoint's
+p99 latency grew, or its throughput fell, by more than --threshold.
+"""
+import argparse
+import json
+import sys
+
+METRICS = ('p50_ms', 'p99_ms', 'throughput_rps')
+
+
+def change(before: float, after: float) -> float:
+    return (after - before) / before if before else 0.0
+
+
+def compare(baseline: dict, candidate: dict, threshold: float = 0.10) -> list:
+    """One row per endpoint present in both runs; `regression` marks the ones over threshold."""
+    rows = []
+    for name, after in candidate['endpoints'].items():
+        before = baseline['endpoints'].get(name)
+        if before is None:
+            continue
+        deltas = {metric: change(before[metric], after[metric]) for metric in METRICS}
+        rows.append({
+            'endpoint': name,
+            **{metric: (before[metric], after[metric], deltas[metric]) for metric in METRICS},
+            'regression': deltas['p99_ms'] > threshold or -deltas['throughput_rps'] > threshold,
+        })
+    return rows
+
+
+def print_table(rows: list, baseline: dict, candidate: dict) -> None:
+    print(f"{baseline.get('label', 'baseline')} -> {candidate.get('label', 'candidate')}")
+    print(f"{'endpoint':<28}" + ''.join(f"{metric:>26}" for metric in METRICS))
+    for row in rows:
+        cells = ''.join(
+            f"{f'{row[metric][0]:g} -> {row[metric][1]:g} ({row[metric][2]:+.0%})':>26}" for metric in METRICS
+        )
+        print(f"{row['endpoint']:<28}{cells}{'  REGRESSION' if row['regression'] else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed relative change (default 0.10)')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    rows = compare(baseline, candidate, args.threshold)
+    print_table(rows, baseline, candidate)
+    sys.exit(1 if any(row['regression'] for row in rows) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Concurrency benchmark for a running Filament Inventory server.
+
+Fires the same GET routes in parallel and reports latency percentiles, so the
+blocking (sync Session) and non-blocking (AsyncSession) data layers can be
+compared under load. Run it once against each build and compare the output:
+
+    python benchmarks/concurrency.py --base-url http://localhost:8090 --label sync
+    python benchmarks/concurrency.py --base-url http://localhost:8090 --label async
+
+Only the harness is provided; no sync/async results are checked in. Write
+them with --output benchmarks/results/concurrency-<label>.json when you run it
+against PostgreSQL (the sync build supports nothing else).
+
+For per-endpoint numbers against a seeded database, use benchmarks/run.py.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+from load import percentile, summarize
+
+DEFAULT_PATHS = [
+    "/select_manufacturer",
+    "/select_filament/1",
+    "/view_inventory",
+    "/manage_manufacturers",
+]
+
+
+async def run(base_url, paths, concurrency, requests_per_path):
+    """All paths at once, interleaved, to see how the routes behave under mixed load."""
+    latencies = {path: [] for path in paths}
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        async def hit(path):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path)
+                latencies[path].append((time.perf_counter() - start) * 1000)
+                if response.status_code >= 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(hit(path) for path in paths for _ in range(requests_per_path)))
+        elapsed = time.perf_counter() - started
+
+    all_samples = [sample for samples in latencies.values() for sample in samples]
+    results = summarize(all_samples, errors, elapsed)
+    results["concurrency"] = concurrency
+    results["routes"] = {
+        path: {"p50_ms": round(statistics.median(samples), 2), "p99_ms": round(percentile(samples, 99), 2)}
+        for path, samples in latencies.items()
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8090")
+    parser.add_argument("--label", default="run", help="name stored with the results, e.g. sync or async")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200, help="requests per path")
+    parser.add_argument("--path", action="append", dest="paths", help="route to hit (repeatable)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.base_url, args.paths or DEFAULT_PATHS, args.concurrency, args.requests))
+    results["label"] = args.label
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Throwaway databases for benchmarks.
+
+BENCH_DATABASE_URL, when set, is used as is. Otherwise a private cluster
+is created with the local PostgreSQL binaries (initdb, pg_ctl) in a
+temporary directory, listening only on a Unix socket and a free localhost
+port, and removed again afterwards. SQLite files are created in a temporary
+directory.
+"""
+import glob
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+BENCH_USER = 'bench'
+BENCH_DATABASE = 'filamento_bench'
+
+
+def find_binary(name: str) -> Optional[str]:
+    # Debian/Ubuntu keep the server binaries out of PATH
+    return shutil.which(name) or next(iter(sorted(glob.glob(f'/usr/lib/postgresql/*/bin/{name}'), reverse=True)), None)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def postgres_url() -> Iterator[str]:
+    """Yield a SQLAlchemy URL for an empty database."""
+    url = os.getenv('BENCH_DATABASE_URL')
+    if url:
+        yield url
+        return
+
+    initdb, pg_ctl = find_binary('initdb'), find_binary('pg_ctl')
+    if not (initdb and pg_ctl):
+        raise RuntimeError('Set BENCH_DATABASE_URL or install PostgreSQL (initdb and pg_ctl) to run the benchmarks')
+
+    workdir = tempfile.mkdtemp(prefix='filamento-bench-')
+    data_dir = os.path.join(workdir, 'data')
+    port = free_port()
+    try:
+        subprocess.run([initdb, '-D', data_dir, '-U', BENCH_USER, '--auth=trust', '-E', 'UTF8'],
+                       check=True, capture_output=True)
+        subprocess.run([
+            pg_ctl, '-D', data_dir, '-l', os.path.join(workdir, 'postgres.log'), '-w',
+            '-o', f"-p {port} -k {workdir} -c listen_addresses=127.0.0.1",
+            'start',
+        ], check=True, capture_output=True)
+        try:
+            subprocess.run([find_binary('createdb') or 'createdb', '-h', workdir, '-p', str(port),
+                            '-U', BENCH_USER, BENCH_DATABASE], check=True, capture_output=True)
+            yield f"postgresql+asyncpg://{BENCH_USER}@127.0.0.1:{port}/{BENCH_DATABASE}"
+        finally:
+            subprocess.run([pg_ctl, '-D', data_dir, '-m', 'fast', 'stop'], capture_output=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+@contextmanager
+def sqlite_url() -> Iterator[str]:
+    """Yield a SQLAlchemy URL for a new SQLite file."""
+    workdir = tempfile.mkdtemp(prefix='filamento-bench-')
+    try:
+        yield f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}"
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
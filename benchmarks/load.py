@@ -0,0 +1,77 @@
+"""HTTP load driver shared by the benchmark scripts."""
+import asyncio
+import statistics
+import time
+from typing import Callable, NamedTuple
+
+import httpx
+
+
+class Scenario(NamedTuple):
+    """One endpoint to benchmark.
+
+    `request` is called with a request number and returns the keyword
+    arguments for httpx.AsyncClient.request (method, url, data, json, ...),
+    so every request can target a different id.
+    """
+    name: str
+    request: Callable[[int], dict]
+
+
+def get(path: str) -> Callable[[int], dict]:
+    return lambda i: {'method': 'GET', 'url': path}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies_ms, errors, elapsed):
+    return {
+        'requests': len(latencies_ms),
+        'errors': errors,
+        'throughput_rps': round(len(latencies_ms) / elapsed, 1),
+        'mean_ms': round(statistics.fmean(latencies_ms), 2),
+        'p50_ms': round(statistics.median(latencies_ms), 2),
+        'p95_ms': round(percentile(latencies_ms, 95), 2),
+        'p99_ms': round(percentile(latencies_ms, 99), 2),
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, concurrency: int, requests: int,
+                       warmup: int = 0) -> dict:
+    """Send `requests` requests with at most `concurrency` in flight and summarize them."""
+    for i in range(warmup):
+        await client.request(**scenario.request(-1 - i))
+
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def hit(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.request(**scenario.request(i))
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(hit(i) for i in range(requests)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def run_scenarios(base_url: str, scenarios, concurrency: int, requests: int, warmup: int = 10) -> dict:
+    """Benchmark each scenario in turn, so every endpoint gets the server to itself."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        return {
+            scenario.name: await run_scenario(client, scenario, concurrency, requests, warmup)
+            for scenario in scenarios
+        }
@@ -0,0 +1,195 @@
+"""Seeded, per-endpoint benchmark of the whole application.
+
+1. gets an empty database (see databases.py): PostgreSQL from
+   BENCH_DATABASE_URL or a private cluster from the local PostgreSQL
+   binaries, or a temporary SQLite file
+2. migrates it with Alembic and fills it with synthetic data (see seed.py)
+3. starts the app with uvicorn against that database
+4. drives every endpoint in turn with httpx and records latency
+   percentiles and throughput
+5. writes the results as JSON, and optionally compares them with an
+   earlier run (see compare.py)
+
+    python benchmarks/run.py --label baseline
+    python benchmarks/run.py --label candidate --compare benchmarks/results/baseline.json
+    python benchmarks/run.py --label backends --backend both   # PostgreSQL vs SQLite
+
+The default dataset is 1k manufacturers, 100k filaments and 1M inventory
+rows; use --manufacturers/--filaments/--inventory for quicker runs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from compare import compare, print_table
+from load import Scenario, get, run_scenarios
+from databases import postgres_url, sqlite_url
+from seed import LOCATIONS, TYPES, add_arguments, seed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATABASES = {'postgres': postgres_url, 'sqlite': sqlite_url}
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+BATCH_SIZE = 20
+
+
+def scenarios(dataset: dict) -> list:
+    manufacturers, filaments = dataset['manufacturers'], dataset['filaments']
+    # Every manufacturer has every type once there are enough filaments
+    types = TYPES[:max(1, min(len(TYPES), filaments // manufacturers))]
+
+    def color_page(i):
+        rng = random.Random(i)
+        return {'method': 'GET', 'url': '/select_color', 'params': {
+            'manufacturer_id': rng.randint(1, manufacturers), 'filament_type': rng.choice(types),
+        }}
+
+    def location_page(i):
+        return {'method': 'GET', 'url': f'/select_location/{random.Random(i).randint(1, filaments)}'}
+
+    def nearest_color(i):
+        return {'method': 'GET', 'url': '/api/colors/nearest',
+                'params': {'hex': f"{random.Random(i).randrange(0x1000000):06X}", 'k': 5}}
+
+    def stock_in(i):
+        rng = random.Random(i)
+        return {'method': 'POST', 'url': f'/select_location/{rng.randint(1, filaments)}',
+                'data': {'location': rng.choice(LOCATIONS), 'quantity': 1}}
+
+    def hot_spool(i):
+        # Every request stocks the same spool; with the stock ledger they no longer queue on one row lock
+        return {'method': 'POST', 'url': '/select_location/1', 'data': {'location': LOCATIONS[0], 'quantity': 1}}
+
+    def stock_batch(i):
+        rng = random.Random(i)
+        return {'method': 'POST', 'url': '/api/inventory/batch', 'json': {'items': [
+            {'filament_id': rng.randint(1, filaments), 'location': rng.choice(LOCATIONS)} for _ in range(BATCH_SIZE)
+        ]}}
+
+    return [
+        Scenario('select_manufacturer', get('/select_manufacturer')),
+        Scenario('select_color', color_page),
+        Scenario('select_location', location_page),
+        Scenario('view_inventory', get('/view_inventory')),
+        Scenario('api_inventory', get('/api/inventory?limit=25&sort=location')),
+        Scenario('nearest_color', nearest_color),
+        Scenario('stock_in', stock_in),
+        Scenario('stock_batch', stock_batch),
+        Scenario('stock_in_hot_spool', hot_spool),
+    ]
+
+
+def migrate(database_url: str) -> None:
+    subprocess.run(['alembic', '-x', f'db_url={database_url}', 'upgrade', 'head'],
+                   cwd=ROOT, check=True, capture_output=True)
+
+
+def server_env(database_url: str) -> dict:
+    env = dict(os.environ)
+    env.update({'DATABASE_URL': database_url, 'LOG_FILE': '', 'LOG_LEVEL': 'WARNING'})
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    return env
+
+
+def start_server(database_url: str, port: int, workers: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app:app', '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning'],
+        cwd=ROOT, env=server_env(database_url),
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'Server exited with status {server.returncode}')
+        try:
+            if httpx.get(f'http://127.0.0.1:{port}/health', timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('Server did not become healthy within 30 seconds')
+
+
+def git_commit() -> str:
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or 'unknown'
+
+
+def benchmark(backend: str, args) -> dict:
+    with DATABASES[backend]() as database_url:
+        migrate(database_url)
+        dataset = asyncio.run(seed(database_url, args.manufacturers, args.filaments, args.inventory, args.seed))
+        print(f"Seeded {backend}: {json.dumps(dataset)}", file=sys.stderr)
+
+        selected = [s for s in scenarios(dataset) if not args.scenarios or s.name in args.scenarios]
+        server = start_server(database_url, args.port, args.workers)
+        try:
+            endpoints = asyncio.run(run_scenarios(
+                f'http://127.0.0.1:{args.port}', selected, args.concurrency, args.requests
+            ))
+        finally:
+            server.terminate()
+            server.wait()
+
+    return {
+        'label': f'{args.label}-{backend}' if args.backend == 'both' else args.label,
+        'backend': backend,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'dataset': dataset,
+        'settings': {'concurrency': args.concurrency, 'requests': args.requests, 'workers': args.workers},
+        'endpoints': endpoints,
+    }
+
+
+def write_results(results: dict, output: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--label', default='run', help='name of this run, also the default output file name')
+    parser.add_argument('--backend', choices=['postgres', 'sqlite', 'both'], default='postgres',
+                        help='both runs PostgreSQL then SQLite and compares them')
+    add_arguments(parser)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=500, help='requests per endpoint')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn workers')
+    parser.add_argument('--port', type=int, default=8091)
+    parser.add_argument('--scenario', action='append', dest='scenarios', help='only run these endpoints (repeatable)')
+    parser.add_argument('--output', help='results file (default benchmarks/results/<label>.json)')
+    parser.add_argument('--compare', metavar='BASELINE', help='compare with an earlier results file')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    args = parser.parse_args()
+
+    if args.backend == 'both':
+        runs = [benchmark(backend, args) for backend in ('postgres', 'sqlite')]
+        for results in runs:
+            write_results(results, os.path.join(RESULTS_DIR, f"{results['label']}.json"))
+        print_table(compare(*runs, args.threshold), *runs)
+        return
+
+    results = benchmark(args.backend, args)
+    write_results(results, args.output or os.path.join(RESULTS_DIR, f'{args.label}.json'))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(baseline, results, args.threshold)
+        print_table(rows, baseline, results)
+        sys.exit(1 if any(row['regression'] for row in rows) else 0)
+
+
+if __name__ == '__main__':
+    main()
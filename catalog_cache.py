@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Union
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from database import DataVersion, StockMovement
+
+CATALOG = "catalog"
+INVENTORY = "inventory"
+
+
+async def get_version(db: AsyncSession, name: str) -> int:
+    """Return the current version counter for a data set (0 if never written)."""
+    version = (await db.execute(select(DataVersion.version).where(DataVersion.name == name))).scalar()
+    return version or 0
+
+
+async def get_versions(db: AsyncSession, *names: str) -> Dict[str, Any]:
+    """Return several version counters in one query.
+
+    Stock writes only append to the ledger and do not touch the inventory
+    counter, which compaction bumps; so the inventory version is the
+    counter together with the number of movements not compacted yet.
+    """
+    rows = (await db.execute(select(DataVersion.name, DataVersion.version).where(DataVersion.name.in_(names)))).all()
+    versions = dict.fromkeys(names, 0)
+    versions.update({name: version for name, version in rows})
+    if INVENTORY in versions:
+        pending = (await db.execute(
+            select(func.count()).select_from(StockMovement).where(StockMovement.uncompacted())
+        )).scalar()
+        versions[INVENTORY] = f"{versions[INVENTORY]}.{pending}"
+    return versions
+
+
+async def bump_version(db: Union[AsyncSession, AsyncConnection], name: str) -> None:
+    """Increment a version counter inside the caller's transaction.
+
+    Must run before the caller commits so that other workers see the new
+    version together with the data it describes. Every writer of a data set
+    queues on its version row, so this is for catalog edits, imports and
+    maintenance jobs; stock writes must not call it (see get_versions).
+    """
+    await db.execute(update(DataVersion).where(DataVersion.name == name).values(version=DataVersion.version + 1))
+
+
+class CatalogCache:
+    """Bounded LRU cache for catalog lookups.
+
+    Entries are only valid for the catalog version they were loaded under.
+    Each lookup reads the version row (a single primary-key lookup) and drops
+    the whole cache when another worker has bumped it, so a stale list is
+    never served.
+    """
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self.version = None
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, db: AsyncSession, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        version = await get_version(db, CATALOG)
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        value = await loader()
+        if self.version == version:
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self.version = None
@@ -0,0 +1,175 @@
+"""Nearest-color lookup over the filament catalog.
+
+Every filament's color_hex_code is converted once to CIELAB and kept in a
+NumPy array, so a query is one vectorized distance computation (CIE76
+ΔE, the Euclidean distance in Lab) over the whole catalog instead of a
+table scan in Python.
+
+Catalog rows are only ever added by the app (manage routes and bulk
+import), so when the catalog version changes the index loads just the
+rows with ids above the highest one it has seen. If the row count no
+longer matches, for example after a manual delete, it reloads everything.
+"""
+import re
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from catalog_cache import CATALOG, INVENTORY, get_version, get_versions
+from database import Manufacturer, Filament
+from ledger import stock
+
+HEX_PATTERN = re.compile(r'^#?([0-9a-fA-F]{6}|[0-9a-fA-F]{3})$')
+# sRGB (D65) to XYZ, and the D65 reference white
+RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+WHITE = np.array([0.95047, 1.0, 1.08883])
+
+
+def parse_hex(value: Optional[str]) -> Optional[tuple]:
+    """(r, g, b) in 0-255 from '#RRGGBB', 'RRGGBB' or '#RGB'; None if invalid."""
+    match = HEX_PATTERN.match((value or '').strip())
+    if not match:
+        return None
+    digits = match.group(1)
+    if len(digits) == 3:
+        digits = ''.join(c * 2 for c in digits)
+    return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """Convert an (n, 3) array of 0-255 sRGB values to CIELAB."""
+    c = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ RGB_TO_XYZ.T / WHITE
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[:, 1] - 16, 500 * (f[:, 0] - f[:, 1]), 200 * (f[:, 1] - f[:, 2])], axis=1)
+
+
+class ColorIndex:
+    """Lab coordinates of every filament with a valid hex code."""
+
+    def __init__(self):
+        self.clear()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, rows) -> None:
+        """Append (id, color_hex_code) rows."""
+        # Another request may have appended the same rows while this one was waiting on the database
+        parsed = [(filament_id, parse_hex(hex_code)) for filament_id, hex_code in rows if filament_id > self.max_id]
+        valid = [(filament_id, rgb) for filament_id, rgb in parsed if rgb is not None]
+        self.rows_seen += len(parsed)
+        self.max_id = max([self.max_id] + [filament_id for filament_id, _ in parsed])
+        if valid:
+            self.ids = np.concatenate([self.ids, np.array([filament_id for filament_id, _ in valid], dtype=np.int64)])
+            self.lab = np.concatenate([self.lab, rgb_to_lab([rgb for _, rgb in valid]).astype(np.float32)])
+
+    def clear(self) -> None:
+        self.ids = np.empty(0, dtype=np.int64)
+        self.lab = np.empty((0, 3), dtype=np.float32)
+        self.version = None
+        self.max_id = 0
+        self.rows_seen = 0
+        self.stocked_version = None
+        self.stocked_mask = np.empty(0, dtype=bool)
+
+    async def in_stock(self, db: AsyncSession) -> np.ndarray:
+        """Mask over ids of the filaments with stock somewhere; reloaded when the inventory version changes."""
+        version = (await get_versions(db, INVENTORY))[INVENTORY], len(self.ids)
+        if version != self.stocked_version:
+            stocked = (await db.execute(
+                select(stock.c.filament_id).where(stock.c.quantity > 0).distinct()
+            )).scalars().all()
+            self.stocked_mask = np.isin(self.ids, np.array(stocked, dtype=np.int64))
+            self.stocked_version = version
+        return self.stocked_mask
+
+    async def refresh(self, db: AsyncSession) -> None:
+        """Bring the index up to the current catalog version."""
+        version = await get_version(db, CATALOG)
+        if version == self.version:
+            return
+        self.add((await db.execute(
+            select(Filament.id, Filament.color_hex_code).where(Filament.id > self.max_id).order_by(Filament.id)
+        )).all())
+        if (await db.execute(select(func.count(Filament.id)))).scalar() != self.rows_seen:
+            rows = (await db.execute(select(Filament.id, Filament.color_hex_code).order_by(Filament.id))).all()
+            self.clear()
+            self.add(rows)
+        self.version = version
+
+    def nearest(self, rgb: tuple, count: Optional[int] = None, mask: Optional[np.ndarray] = None) -> tuple:
+        """(ids, distances) of the `count` nearest colors, nearest first; all of them when count is None.
+
+        `mask`, a boolean array over ids, restricts the search to those filaments.
+        """
+        ids, lab = self.ids, self.lab
+        if mask is not None:
+            ids, lab = ids[mask], lab[mask]
+        diff = lab - rgb_to_lab([rgb]).astype(np.float32)
+        squared = np.einsum('ij,ij->i', diff, diff)
+        if count is not None and count < len(squared):
+            order = np.argpartition(squared, count)[:count]
+            order = order[np.argsort(squared[order], kind='stable')]
+        else:
+            order = np.argsort(squared, kind='stable')
+        return ids[order], np.sqrt(squared[order])
+
+color_index = ColorIndex()
+
+
+def details_query(ids: List[int]):
+    return select(
+        Filament.id, Manufacturer.name, Filament.type, Filament.color_name, Filament.color_hex_code,
+        stock.c.location, stock.c.quantity
+    ).join(Manufacturer, Filament.manufacturer_id == Manufacturer.id
+    ).outerjoin(stock, (stock.c.filament_id == Filament.id) & (stock.c.quantity > 0)
+    ).where(Filament.id.in_(ids)
+    ).order_by(Filament.id, stock.c.location)
+
+
+async def nearest_colors(db: AsyncSession, hex_code: str, k: int = 5, in_stock: bool = True) -> List[dict]:
+    """The k filaments closest to hex_code, with their stock locations.
+
+    With in_stock, only filaments that have stock somewhere count: the
+    search runs over the cached stocked ids, so at most k ids are ever sent
+    back to the database.
+    """
+    rgb = parse_hex(hex_code)
+    if rgb is None:
+        raise ValueError(f"Invalid hex color: {hex_code}")
+    await color_index.refresh(db)
+
+    mask = await color_index.in_stock(db) if in_stock else None
+    ids, distances = color_index.nearest(rgb, k, mask)
+    if not len(ids):
+        return []
+
+    entries = {}
+    for filament_id, manufacturer, filament_type, color_name, color_hex_code, location, quantity in (
+        await db.execute(details_query(ids.tolist()))
+    ).all():
+        entry = entries.setdefault(filament_id, {
+            'filament_id': filament_id,
+            'manufacturer': manufacturer,
+            'type': filament_type,
+            'color_name': color_name,
+            'color_hex_code': color_hex_code,
+            'quantity': 0,
+            'locations': [],
+        })
+        if location is not None:
+            entry['locations'].append({'location': location, 'quantity': quantity})
+            entry['quantity'] += quantity
+    return [
+        dict(entries[filament_id], delta_e=round(distance, 2))
+        for filament_id, distance in zip(ids.tolist(), distances.tolist())
+        if filament_id in entries
+    ]
@@ -0,0 +1,199 @@
+import os
+from typing import Optional, Union
+from uuid import uuid4
+
+from dotenv import load_dotenv
+from sqlalchemy import Column, Integer, BigInteger, Boolean, DateTime, String, ForeignKey, Index, event, func, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncConnection, AsyncEngine, AsyncSession
+from sqlalchemy.orm import declarative_base
+
+# Load environment variables
+load_dotenv()
+
+# Database setup
+# The schema is managed by Alembic (see migrations/); run `alembic upgrade head` before starting the app.
+# DATABASE_URL selects the backend, e.g. sqlite+aiosqlite:////data/filamento.db for a single-node
+# install. Without it the PostgreSQL URL is built from the DB_* variables.
+DB_USER = os.getenv('DB_USER')
+DB_PASSWORD = os.getenv('DB_PASSWORD')
+DB_HOST = os.getenv('DB_HOST')
+DB_PORT = os.getenv('DB_PORT', '5432')
+DB_DATABASE = os.getenv('DB_DATABASE')
+
+SQLALCHEMY_DATABASE_URL = os.getenv('DATABASE_URL') or f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_DATABASE}"
+# Optional replica for the read-only routes (see get_read_db); same form as DATABASE_URL
+DB_READ_URL = os.getenv('DB_READ_URL')
+
+# PostgreSQL pool, per uvicorn worker: the server sees up to workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+# connections. Instead of a ping on every checkout, connections are replaced after DB_POOL_RECYCLE
+# seconds (-1 never); set DB_POOL_PRE_PING=true when idle connections get cut by a firewall or failover.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'false').lower() in ('1', 'true', 'yes')
+# Behind PgBouncer in transaction mode, PgBouncer does the pooling and a server connection
+# may change between statements, so no pool and no named prepared statements on our side
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', 'false').lower() in ('1', 'true', 'yes')
+
+# Applied to every new SQLite connection. WAL lets readers in all uvicorn workers run
+# alongside the single writer; busy_timeout makes a writer wait for the lock instead of
+# failing; synchronous=NORMAL is durable across crashes of the app (not of the OS) in WAL mode.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'),
+    'mmap_size': os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)),
+    'cache_size': '-65536',
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+}
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == 'sqlite'
+
+def pool_options(pgbouncer: bool = DB_PGBOUNCER) -> dict:
+    """create_async_engine arguments for a PostgreSQL pool, from the DB_POOL_* settings."""
+    if pgbouncer:
+        return {
+            'poolclass': NullPool,
+            'connect_args': {
+                'statement_cache_size': 0,
+                'prepared_statement_cache_size': 0,
+                'prepared_statement_name_func': lambda: f"__asyncpg_{uuid4()}__",
+            },
+        }
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+
+def create_engine(url: str) -> AsyncEngine:
+    """Engine for url; PostgreSQL gets pool_options(), SQLite connections get SQLITE_PRAGMAS."""
+    if not is_sqlite(url):
+        return create_async_engine(url, **pool_options())
+
+    # SQLAlchemy defaults to NullPool for SQLite files; keep connections (and their pragmas) open instead
+    database = make_url(url).database
+    on_disk = database not in (None, '', ':memory:')
+    sqlite_engine = create_async_engine(url, poolclass=AsyncAdaptedQueuePool) if on_disk else create_async_engine(url)
+
+    @event.listens_for(sqlite_engine.sync_engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return sqlite_engine
+
+def upsert(db: Union[AsyncSession, AsyncConnection], table):
+    """INSERT supporting on_conflict_do_update/do_nothing on the backend db is bound to."""
+    dialect = db.get_bind().dialect if isinstance(db, AsyncSession) else db.dialect
+    return (sqlite_insert if dialect.name == 'sqlite' else postgresql_insert)(table)
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
+SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+# Without DB_READ_URL reads share the primary engine
+read_engine: Optional[AsyncEngine] = create_engine(DB_READ_URL) if DB_READ_URL else None
+ReadSessionLocal = async_sessionmaker(bind=read_engine or engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+Base = declarative_base()
+
+# Define SQLAlchemy models
+class Manufacturer(Base):
+    __tablename__ = "manufacturer"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), unique=True, index=True)
+
+    __table_args__ = (
+        Index('ix_manufacturer_name_sort', text("coalesce(name, '')"), 'id'),
+    )
+
+class Filament(Base):
+    __tablename__ = "filament"
+    id = Column(Integer, primary_key=True, index=True)
+    manufacturer_id = Column(Integer, ForeignKey("manufacturer.id"))
+    type = Column(String)
+    color_name = Column(String)
+    color_hex_code = Column(String)
+
+    __table_args__ = (
+        Index('uq_filament_manufacturer_type_color', 'manufacturer_id', 'type', 'color_name', unique=True),
+        # Keyset sort keys of /api/inventory (see migration 0008)
+        Index('ix_filament_type_sort', text("coalesce(type, '')"), 'id'),
+        Index('ix_filament_color_name_sort', text("coalesce(color_name, '')"), 'id'),
+        Index('ix_filament_manufacturer_id', 'manufacturer_id', 'id'),
+    )
+
+class Inventory(Base):
+    """Stock snapshot: quantities as of the last ledger compaction (see ledger.py)."""
+    __tablename__ = "inventory"
+    id = Column(Integer, primary_key=True, index=True)
+    filament_id = Column(Integer, ForeignKey("filament.id"))
+    location = Column(String)
+    quantity = Column(Integer)
+
+    __table_args__ = (
+        Index('uq_inventory_filament_location', 'filament_id', 'location', unique=True),
+        Index('ix_inventory_location', 'location'),
+        Index('ix_inventory_location_sort', text("coalesce(location, '')"), 'id'),
+        Index('ix_inventory_filament_id', 'filament_id', 'id'),
+    )
+
+class ShelfOccupancy(Base):
+    """Spools per shelf location in the inventory snapshot, updated by ledger compaction."""
+    __tablename__ = "shelf_occupancy"
+    location = Column(String, primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+
+class StockMovement(Base):
+    """Append-only stock ledger: one row per change, positive for stock-in, negative for use.
+
+    Rows not yet folded into the inventory snapshot have compacted = false;
+    the partial index keeps that tail cheap to aggregate.
+    """
+    __tablename__ = "stock_movement"
+    # SQLite only autoincrements an INTEGER PRIMARY KEY
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    filament_id = Column(Integer, ForeignKey("filament.id"), nullable=False)
+    location = Column(String, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    reason = Column(String(20), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    compacted = Column(Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        Index('ix_stock_movement_tail', 'id',
+              postgresql_where=text('NOT compacted'), sqlite_where=text('compacted = 0')),
+        Index('ix_stock_movement_created_at', 'created_at'),
+        Index('ix_stock_movement_filament', 'filament_id', 'id'),
+        Index('ix_stock_movement_pending', 'filament_id', 'location',
+              postgresql_where=text('NOT compacted'), sqlite_where=text('compacted = 0')),
+    )
+
+    @classmethod
+    def uncompacted(cls):
+        # Renders as NOT compacted / compacted = 0, matching the partial index on each backend
+        return ~cls.compacted
+
+class DataVersion(Base):
+    __tablename__ = "data_version"
+    name = Column(String(50), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+# Dependencies
+async def get_db():
+    async with SessionLocal() as db:
+        yield db
+
+async def get_read_db():
+    """Session on the read replica, for routes that never write. It may lag the primary slightly."""
+    async with ReadSessionLocal() as db:
+        yield db
@@ -0,0 +1,203 @@
+"""Live inventory events for connected pages.
+
+Stock writes publish an event with the inventory rows and per-location
+spool counts they changed. /api/events streams those events to browsers
+as Server-Sent Events, so open inventory and shelf pages can update
+themselves instead of polling the inventory query.
+
+Events are sent only after the write transaction commits, so a write
+that rolled back is never announced. On PostgreSQL they go out with
+pg_notify on a pooled connection in autocommit mode, and reach every
+uvicorn worker, because each worker LISTENs on its own dedicated
+connection. Sending the NOTIFY outside the write keeps PostgreSQL's
+database-wide notification-queue lock out of the stock transactions, so
+stock writes do not commit one at a time. If sending fails, this worker's
+clients get a reset event. On other backends events are broadcast
+in-process, which reaches only the worker that made the write; that is
+enough for single-worker installs.
+"""
+import asyncio
+import json
+import logging
+from typing import List, Optional, Set, Union
+
+import asyncpg
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+from metrics import EVENT_SUBSCRIBERS
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'filamento_events'
+# NOTIFY payloads must stay below 8000 bytes; larger events are sent without their rows, or as a reset
+MAX_PAYLOAD = 7500
+SUBSCRIBER_QUEUE_SIZE = 100
+RECONNECT_DELAY = 5
+
+
+def stock_event(rows: list) -> dict:
+    """Event for merged stock rows: the inventory deltas and the spools added per location."""
+    occupancy = {}
+    for row in rows:
+        occupancy[row['location']] = occupancy.get(row['location'], 0) + row['quantity']
+    return {'type': 'stock', 'rows': rows, 'occupancy': occupancy}
+
+
+def reset_event() -> dict:
+    """Tells clients to reload their data, e.g. after a rebuild or missed events."""
+    return {'type': 'reset'}
+
+
+def encode(event: dict) -> str:
+    """JSON for event, under MAX_PAYLOAD: without its rows if needed, else a reset."""
+    payload = json.dumps(event, separators=(',', ':'))
+    if len(payload) > MAX_PAYLOAD and event.get('rows'):
+        payload = json.dumps(dict(event, rows=None), separators=(',', ':'))
+    if len(payload) > MAX_PAYLOAD:
+        payload = json.dumps(reset_event(), separators=(',', ':'))
+    return payload
+
+
+class Broadcaster:
+    """Fans events out to the subscribers connected to this worker.
+
+    Every subscriber gets a bounded queue. If a subscriber falls behind, its
+    backlog is replaced with a single reset event instead of buffering
+    without limit.
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        EVENT_SUBSCRIBERS.inc()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        if queue in self._subscribers:
+            self._subscribers.discard(queue)
+            EVENT_SUBSCRIBERS.dec()
+
+    def publish(self, event: dict) -> None:
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(reset_event())
+
+
+broadcaster = Broadcaster()
+
+
+# Notifications being sent; kept referenced until they finish
+_notifying: Set[asyncio.Task] = set()
+
+
+async def notify(engine: AsyncEngine, events: List[dict]) -> None:
+    """Send events with pg_notify in one autocommit statement, outside any write transaction."""
+    try:
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level='AUTOCOMMIT')
+            await conn.execute(select(*(func.pg_notify(CHANNEL, encode(event)) for event in events)))
+    except Exception as e:
+        logger.error(f"Error sending stock events: {str(e)}")
+        broadcaster.publish(reset_event())
+
+
+async def publish(db: AsyncSession, event: dict) -> None:
+    """Publish event once the caller's transaction commits."""
+    db.info.setdefault('pending_events', []).append(event)
+    if db.get_bind().dialect.name == 'postgresql':
+        db.info['notify_engine'] = db.bind
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_pending(session: Session) -> None:
+    events = session.info.pop('pending_events', [])
+    engine = session.info.pop('notify_engine', None)
+    if not events:
+        return
+    if engine is None:
+        for pending in events:
+            broadcaster.publish(pending)
+        return
+    task = asyncio.get_running_loop().create_task(notify(engine, events))
+    _notifying.add(task)
+    task.add_done_callback(_notifying.discard)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session: Session) -> None:
+    session.info.pop('pending_events', None)
+    session.info.pop('notify_engine', None)
+
+
+class PostgresListener:
+    """LISTENs on CHANNEL over a dedicated connection and feeds the broadcaster.
+
+    The connection is outside the pool. LISTEN needs a session of its own,
+    so behind PgBouncer in transaction mode give it a direct URL. If it
+    drops, the listener reconnects and sends subscribers a reset event,
+    because notifications sent while it was disconnected are lost.
+    """
+
+    def __init__(self, url: Union[str, URL], target: Broadcaster = broadcaster):
+        self.dsn = make_url(url).set(drivername='postgresql').render_as_string(hide_password=False)
+        self.target = target
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _notify(self, connection, pid, channel, payload) -> None:
+        try:
+            self.target.publish(json.loads(payload))
+        except ValueError:
+            logger.warning(f"Ignoring malformed event on {channel}")
+
+    async def _run(self) -> None:
+        connected_before = False
+        while True:
+            try:
+                conn = await asyncpg.connect(self.dsn)
+            except Exception as e:
+                logger.error(f"Event listener cannot connect: {str(e)}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            closed = asyncio.Event()
+            try:
+                conn.add_termination_listener(lambda _: closed.set())
+                await conn.add_listener(CHANNEL, self._notify)
+                if connected_before:
+                    self.target.publish(reset_event())
+                connected_before = True
+                await closed.wait()
+                logger.warning("Event listener connection closed, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Event listener failed: {str(e)}")
+            finally:
+                if not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(RECONNECT_DELAY)
@@ -0,0 +1,120 @@
+"""Response compression and conditional GET helpers."""
+import gzip
+import hashlib
+import zlib
+from typing import Iterable, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+
+from assets import accepted_encodings
+
+COMPRESSIBLE_MEDIA_TYPES = ('text/html', 'application/json', 'text/csv')
+
+
+def make_etag(request: Request, *parts) -> str:
+    """Weak ETag for the requested URL and the data versions it was rendered from.
+
+    Weak because the compression middleware may change the bytes on the wire.
+    """
+    key = '|'.join([request.url.path, request.url.query, *map(str, parts)])
+    return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    candidates = {candidate.strip() for candidate in header.split(',')}
+    # Weak comparison: W/"x" and "x" match
+    return '*' in candidates or etag in candidates or etag[2:] in candidates
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+
+def check_not_modified(request: Request, etag: str) -> Optional[Response]:
+    """A 304 for the request if the client already holds `etag`, else None."""
+    return not_modified(etag) if etag_matches(request, etag) else None
+
+
+def with_etag(response: Response, etag: str) -> Response:
+    response.headers['ETag'] = etag
+    # Always revalidate; the ETag makes that a cheap 304
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+class CompressionMiddleware:
+    """Gzip HTML, JSON and CSV responses for clients that accept it.
+
+    Complete bodies under minimum_size are sent as is. Streamed bodies are
+    compressed chunk by chunk with a sync flush, so each chunk reaches the
+    client immediately instead of waiting in the compressor's buffer. Other
+    media types (static files, which come precompressed, and event streams)
+    pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, compresslevel: int = 6,
+                 media_types: Iterable[str] = COMPRESSIBLE_MEDIA_TYPES):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+        self.media_types = tuple(media_types)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or 'gzip' not in accepted_encodings(Headers(scope=scope).get('accept-encoding', '')):
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message['type'] == 'http.response.start':
+                headers = Headers(raw=message['headers'])
+                media_type = headers.get('content-type', '').split(';')[0].strip()
+                if media_type not in self.media_types or 'content-encoding' in headers:
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if passthrough or message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message['headers'])
+                if not more_body:
+                    # Complete response in a single message
+                    if len(body) >= self.minimum_size:
+                        body = gzip.compress(body, compresslevel=self.compresslevel)
+                        headers['Content-Encoding'] = 'gzip'
+                        headers['Content-Length'] = str(len(body))
+                        headers.add_vary_header('Accept-Encoding')
+                    await send(start_message)
+                    await send({'type': 'http.response.body', 'body': body})
+                    return
+                compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                headers['Content-Encoding'] = 'gzip'
+                headers.add_vary_header('Accept-Encoding')
+                if 'content-length' in headers:
+                    del headers['Content-Length']
+                await send(start_message)
+
+            if more_body:
+                chunk = compressor.compress(body) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            else:
+                chunk = compressor.compress(body) + compressor.flush()
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': more_body})
+
+        await self.app(scope, receive, send_wrapper)
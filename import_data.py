@@ -1,14 +1,286 @@
-import psycopg2
+"""Bulk import of the filament catalog and streaming export of the inventory.
 
-def get_db_connection():
-    conn = psycopg2.connect(
-        host="localhost",
-        database="filament_inventory",
-        user="your_username",
-        password="your_password"
-    )
-    return conn
+Catalog files are streamed into a temporary staging table (with COPY on
+PostgreSQL, batched inserts on SQLite) and merged into manufacturer and
+filament with set-based statements, so a 50k row file costs a handful of
+statements instead of one form post per row. Rows that already exist, by
+manufacturer name or by (manufacturer, type, color_name), are skipped.
+
+Accepted formats:
+    csv   header row naming some of: manufacturer, type, color_name, color_hex_code
+    json  one object per line (NDJSON) with the same keys
+
+Usage:
+    python import_data.py import catalog.csv
+    python import_data.py import catalog.ndjson --format json
+    python import_data.py export inventory.csv
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import io
+import json
+import os
+import sys
+from typing import AsyncIterator, List, Tuple
+
+import aiofiles
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from database import engine, ReadSessionLocal, Manufacturer, Filament
+from catalog_cache import CATALOG, bump_version
+from ledger import stock
+
+CATALOG_COLUMNS = ('manufacturer', 'type', 'color_name', 'color_hex_code')
+REQUIRED_COLUMNS = {'manufacturer', 'type', 'color_name'}
+CHUNK_SIZE = 64 * 1024
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+
+STAGING_COLUMNS = "manufacturer TEXT, type TEXT, color_name TEXT, color_hex_code TEXT"
+CREATE_STAGING = {
+    'postgresql': f"CREATE TEMPORARY TABLE catalog_staging ({STAGING_COLUMNS}) ON COMMIT DROP",
+    'sqlite': f"CREATE TEMPORARY TABLE catalog_staging ({STAGING_COLUMNS})",
+}
+STAGE_RECORD = (
+    "INSERT INTO catalog_staging (manufacturer, type, color_name, color_hex_code) "
+    "VALUES (:manufacturer, :type, :color_name, :color_hex_code)"
+)
+MERGE_MANUFACTURERS = (
+    "INSERT INTO manufacturer (name) "
+    "SELECT DISTINCT manufacturer FROM catalog_staging "
+    "WHERE manufacturer IS NOT NULL AND type IS NOT NULL AND color_name IS NOT NULL "
+    "ON CONFLICT (name) DO NOTHING"
+)
+MERGE_FILAMENTS = (
+    "INSERT INTO filament (manufacturer_id, type, color_name, color_hex_code) "
+    "SELECT m.id, s.type, s.color_name, MIN(s.color_hex_code) "
+    "FROM catalog_staging s JOIN manufacturer m ON m.name = s.manufacturer "
+    "WHERE s.type IS NOT NULL AND s.color_name IS NOT NULL "
+    "GROUP BY m.id, s.type, s.color_name "
+    "ON CONFLICT (manufacturer_id, type, color_name) DO NOTHING"
+)
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def guess_format(filename: str) -> str:
+    return 'json' if os.path.splitext(filename or '')[1].lower() in ('.json', '.ndjson', '.jsonl') else 'csv'
+
+
+def check_columns(columns: List[str]) -> None:
+    unknown = set(columns) - set(CATALOG_COLUMNS)
+    if unknown:
+        raise ImportFormatError(f"Unknown columns: {', '.join(sorted(unknown))}")
+    missing = REQUIRED_COLUMNS - set(columns)
+    if missing:
+        raise ImportFormatError(f"Missing columns: {', '.join(sorted(missing))}")
+
+
+async def split_csv_header(chunks: AsyncIterator[bytes]) -> Tuple[List[str], AsyncIterator[bytes]]:
+    """Read the header row and return its columns plus the remaining byte stream."""
+    iterator = chunks.__aiter__()
+    buffer = b''
+    while b'\n' not in buffer:
+        try:
+            buffer += await iterator.__anext__()
+        except StopAsyncIteration:
+            break
+    header, _, rest = buffer.partition(b'\n')
+    columns = [c.strip().lower() for c in next(csv.reader([header.decode('utf-8-sig')]), [])]
+    check_columns(columns)
+
+    async def body():
+        if rest:
+            yield rest
+        async for chunk in iterator:
+            yield chunk
+
+    return columns, body()
+
+
+def record_boundary(data: str) -> int:
+    """Offset just past the last newline that ends a CSV record rather than a quoted field's line."""
+    boundary, quotes, start = 0, 0, 0
+    while (newline := data.find('\n', start)) != -1:
+        quotes += data.count('"', start, newline)
+        if quotes % 2 == 0:
+            boundary = newline + 1
+        start = newline + 1
+    return boundary
+
+
+async def csv_records(columns: List[str], body: AsyncIterator[bytes]) -> AsyncIterator[tuple]:
+    """Yield staging tuples from a CSV body, reading empty fields as NULL like COPY does."""
+    def records(complete):
+        for row in csv.reader(io.StringIO(complete)):
+            if not row:
+                continue
+            if len(row) != len(columns):
+                raise ImportFormatError(f"Expected {len(columns)} fields, got {len(row)}: {row}")
+            values = dict(zip(columns, row))
+            yield tuple(values.get(c) or None for c in CATALOG_COLUMNS)
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    async for chunk in body:
+        buffer += decoder.decode(chunk)
+        end = record_boundary(buffer)
+        for record in records(buffer[:end]):
+            yield record
+        buffer = buffer[end:]
+    for record in records(buffer + decoder.decode(b'', final=True)):
+        yield record
+
+
+async def json_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple]:
+    """Yield staging tuples from NDJSON without holding the whole file."""
+    def record(line):
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            raise ImportFormatError(f"Invalid JSON line: {e}")
+        if not isinstance(item, dict):
+            raise ImportFormatError("Each JSON line must be an object")
+        return tuple(None if item.get(c) is None else str(item[c]) for c in CATALOG_COLUMNS)
+
+    buffer = b''
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            if line.strip():
+                yield record(line)
+    if buffer.strip():
+        yield record(buffer)
+
+
+async def stage_records(conn: AsyncConnection, records: AsyncIterator[tuple]) -> None:
+    """Insert staging tuples in batches, for backends without COPY."""
+    batch = []
+    async for record in records:
+        batch.append(dict(zip(CATALOG_COLUMNS, record)))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await conn.execute(text(STAGE_RECORD), batch)
+            batch = []
+    if batch:
+        await conn.execute(text(STAGE_RECORD), batch)
+
+
+async def import_catalog(conn: AsyncConnection, chunks: AsyncIterator[bytes], fmt: str = 'csv') -> dict:
+    """Stream a catalog file into staging and merge it.
+
+    Runs inside the caller's transaction (the staging table is dropped on
+    commit) and bumps the catalog version so every worker reloads its cache.
+    """
+    if fmt not in ('csv', 'json'):
+        raise ImportFormatError(f"Unsupported format: {fmt}")
+    copy = conn.dialect.name == 'postgresql'
+    if not copy:
+        # No ON COMMIT DROP; a failed import can leave the table on this pooled connection
+        await conn.execute(text("DROP TABLE IF EXISTS temp.catalog_staging"))
+    await conn.execute(text(CREATE_STAGING['postgresql' if copy else 'sqlite']))
+
+    if fmt == 'csv':
+        columns, body = await split_csv_header(chunks)
+        if copy:
+            pg = (await conn.get_raw_connection()).driver_connection
+            await pg.copy_to_table('catalog_staging', source=body, columns=columns, format='csv')
+        else:
+            await stage_records(conn, csv_records(columns, body))
+    elif copy:
+        pg = (await conn.get_raw_connection()).driver_connection
+        await pg.copy_records_to_table('catalog_staging', records=json_records(chunks), columns=list(CATALOG_COLUMNS))
+    else:
+        await stage_records(conn, json_records(chunks))
+
+    staged = (await conn.execute(text("SELECT count(*) FROM catalog_staging"))).scalar()
+    manufacturers = (await conn.execute(text(MERGE_MANUFACTURERS))).rowcount
+    filaments = (await conn.execute(text(MERGE_FILAMENTS))).rowcount
+    if not copy:
+        await conn.execute(text("DROP TABLE catalog_staging"))
+    await bump_version(conn, CATALOG)
+    return {'rows': staged, 'manufacturers_added': manufacturers, 'filaments_added': filaments}
+
+
+def inventory_export_query():
+    return select(
+        Manufacturer.name,
+        Filament.type,
+        Filament.color_name,
+        Filament.color_hex_code,
+        stock.c.location,
+        stock.c.quantity
+    ).join(Filament, stock.c.filament_id == Filament.id
+    ).join(Manufacturer, Filament.manufacturer_id == Manufacturer.id
+    ).where(stock.c.quantity > 0
+    ).order_by(Manufacturer.name, Filament.type, Filament.color_name, stock.c.location)
+
+
+async def export_inventory_csv() -> AsyncIterator[str]:
+    """Yield the joined inventory as CSV text, one batch of rows at a time.
+
+    Rows come from a server-side cursor, so memory use is bounded by
+    EXPORT_BATCH_SIZE regardless of inventory size.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['manufacturer', 'type', 'color_name', 'color_hex_code', 'location', 'quantity'])
+    async with ReadSessionLocal() as db:
+        result = await db.stream(inventory_export_query().execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def read_file(path: str) -> AsyncIterator[bytes]:
+    async with aiofiles.open(path, 'rb') as f:
+        while chunk := await f.read(CHUNK_SIZE):
+            yield chunk
+
+
+async def run_import(path: str, fmt: str) -> dict:
+    async with engine.begin() as conn:
+        stats = await import_catalog(conn, read_file(path), fmt)
+    await engine.dispose()
+    return stats
+
+
+async def run_export(path: str) -> None:
+    out = sys.stdout if path == '-' else open(path, 'w', newline='')
+    try:
+        async for text_chunk in export_inventory_csv():
+            out.write(text_chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help='bulk import a catalog file')
+    import_parser.add_argument('path')
+    import_parser.add_argument('--format', choices=['csv', 'json'], help='defaults to the file extension')
+    export_parser = commands.add_parser('export', help='export the inventory as CSV')
+    export_parser.add_argument('path', help="output file, or - for stdout")
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        fmt = args.format or guess_format(args.path)
+        print(json.dumps(asyncio.run(run_import(args.path, fmt))))
+    else:
+        asyncio.run(run_export(args.path))
 
 
 if __name__ == '__main__':
-    print("This script no longer performs data import.")
+    main()
@@ -0,0 +1,264 @@
+"""Stock movement ledger and snapshot compaction.
+
+Stock writes only append to stock_movement (see stock.py), so concurrent
+stock-ins of the same spool never wait on each other's row locks; only
+stock-outs of the same spool queue, so that it cannot go below zero.
+inventory and shelf_occupancy are the snapshot: quantities as of the last
+compaction. Readers add the un-compacted tail of the ledger on top, via
+current_stock() and tail_occupancy().
+
+compact() folds the tail into the snapshot in one transaction. Each worker
+runs it every LEDGER_COMPACT_INTERVAL seconds (0 disables), and a
+PostgreSQL advisory lock lets only one of them do the work. The ledger
+itself is kept as usage history; consumption() reports from it.
+
+    python ledger.py compact
+    python ledger.py report --days 30
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from sqlalchemy import and_, func, select, text, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from catalog_cache import INVENTORY, bump_version
+from database import engine, SessionLocal, Manufacturer, Filament, Inventory, ShelfOccupancy, StockMovement, upsert
+
+logger = logging.getLogger(__name__)
+
+LEDGER_COMPACT_INTERVAL = float(os.getenv('LEDGER_COMPACT_INTERVAL', '30'))
+# pg_try_advisory_xact_lock key held by the worker that is compacting
+COMPACTION_LOCK = 7_160_571
+
+
+def tail():
+    """Un-compacted movements summed per (filament_id, location)."""
+    return select(
+        StockMovement.filament_id,
+        StockMovement.location,
+        func.sum(StockMovement.quantity).label('quantity')
+    ).where(StockMovement.uncompacted()
+    ).group_by(StockMovement.filament_id, StockMovement.location
+    ).subquery('tail')
+
+
+def current_stock():
+    """Inventory rows with the ledger tail applied; use in place of the inventory table when reading.
+
+    Every (filament_id, location) that has ever been stocked has a snapshot
+    row (stock.add_stock creates it), so the snapshot ids stay usable for
+    keyset pagination.
+    """
+    movements = tail()
+    return select(
+        Inventory.id,
+        Inventory.filament_id,
+        Inventory.location,
+        (func.coalesce(Inventory.quantity, 0) + func.coalesce(movements.c.quantity, 0)).label('quantity')
+    ).outerjoin(movements, and_(
+        movements.c.filament_id == Inventory.filament_id,
+        movements.c.location == Inventory.location
+    )).subquery('stock')
+
+
+stock = current_stock()
+
+
+def has_pending(filament_id, location):
+    """EXISTS condition: the (filament_id, location) row has un-compacted movements."""
+    return select(StockMovement.id).where(
+        StockMovement.filament_id == filament_id,
+        StockMovement.location == location,
+        StockMovement.uncompacted()
+    ).exists()
+
+
+def pending_query(pairs: List[tuple]):
+    """Un-compacted quantity per (filament_id, location), for just the given pairs."""
+    return select(StockMovement.filament_id, StockMovement.location, func.sum(StockMovement.quantity)).where(
+        StockMovement.uncompacted(),
+        tuple_(StockMovement.filament_id, StockMovement.location).in_(pairs)
+    ).group_by(StockMovement.filament_id, StockMovement.location)
+
+
+async def pending_quantities(db: AsyncSession, pairs: List[tuple]) -> Dict[tuple, int]:
+    if not pairs:
+        return {}
+    rows = (await db.execute(pending_query(pairs))).all()
+    return {(filament_id, location): quantity for filament_id, location, quantity in rows}
+
+
+async def tail_occupancy(db: AsyncSession) -> Dict[str, int]:
+    """Spools per location added (or removed) since the last compaction."""
+    rows = (await db.execute(
+        select(StockMovement.location, func.sum(StockMovement.quantity))
+        .where(StockMovement.uncompacted())
+        .group_by(StockMovement.location)
+    )).all()
+    return {location: quantity for location, quantity in rows if quantity}
+
+
+async def add_occupancy(db: AsyncSession, rows: list) -> None:
+    """Add stock rows to the per-location snapshot totals."""
+    totals = defaultdict(int)
+    for row in rows:
+        totals[row['location']] += row['quantity']
+    stmt = upsert(db, ShelfOccupancy).values([
+        {'location': location, 'quantity': quantity} for location, quantity in sorted(totals.items())
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ShelfOccupancy.location],
+        set_={'quantity': ShelfOccupancy.quantity + stmt.excluded.quantity}
+    )
+    await db.execute(stmt)
+
+
+async def compact(db: AsyncSession) -> int:
+    """Fold the ledger tail into inventory and shelf_occupancy; the caller commits.
+
+    Returns the number of movements folded, 0 if there were none or another
+    worker is compacting.
+    """
+    if db.get_bind().dialect.name == 'postgresql':
+        # One snapshot for the whole transaction, so the UPDATE below marks exactly
+        # the movements that were summed; later inserts stay in the tail
+        conn = await db.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+        locked = (await conn.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {'key': COMPACTION_LOCK})).scalar()
+        if not locked:
+            return 0
+    # Taking the version row first also takes the SQLite write lock before anything is read
+    await bump_version(db, INVENTORY)
+
+    movements = (await db.execute(
+        select(
+            StockMovement.filament_id,
+            StockMovement.location,
+            func.sum(StockMovement.quantity),
+            func.count(),
+            func.max(StockMovement.id)
+        ).where(StockMovement.uncompacted()
+        ).group_by(StockMovement.filament_id, StockMovement.location
+        ).order_by(StockMovement.filament_id, StockMovement.location)
+    )).all()
+    if not movements:
+        await db.rollback()
+        return 0
+
+    rows = [
+        {'filament_id': filament_id, 'location': location, 'quantity': quantity}
+        for filament_id, location, quantity, _, _ in movements
+    ]
+    await db.execute(
+        update(StockMovement)
+        .where(StockMovement.uncompacted(), StockMovement.id <= max(row[4] for row in movements))
+        .values(compacted=True)
+    )
+    stmt = upsert(db, Inventory).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Inventory.filament_id, Inventory.location],
+        set_={'quantity': func.coalesce(Inventory.quantity, 0) + stmt.excluded.quantity}
+    )
+    await db.execute(stmt)
+    await add_occupancy(db, rows)
+    return sum(row[3] for row in movements)
+
+
+async def compact_periodically(interval: float = LEDGER_COMPACT_INTERVAL) -> None:
+    """Background task: compact every `interval` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with SessionLocal() as db:
+                folded = await compact(db)
+                await db.commit()
+            if folded:
+                logger.info(f"Compacted {folded} stock movements")
+        except Exception as e:
+            logger.error(f"Error compacting stock ledger: {str(e)}")
+
+
+def history_query(filament_id: int, limit: int = 100):
+    """The most recent movements of one filament, newest first."""
+    return select(
+        StockMovement.id, StockMovement.location, StockMovement.quantity, StockMovement.reason,
+        StockMovement.created_at
+    ).where(StockMovement.filament_id == filament_id
+    ).order_by(StockMovement.id.desc()
+    ).limit(limit)
+
+
+async def history(db: AsyncSession, filament_id: int, limit: int = 100) -> List[dict]:
+    rows = (await db.execute(history_query(filament_id, limit))).all()
+    return [
+        {'id': row.id, 'location': row.location, 'quantity': row.quantity, 'reason': row.reason,
+         'created_at': row.created_at.isoformat() if row.created_at else None}
+        for row in rows
+    ]
+
+
+async def consumption(db: AsyncSession, days: int = 30, limit: int = 20) -> List[dict]:
+    """Filaments used most over the last `days` days, with their rate and how long current stock lasts."""
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    consumed = func.sum(-StockMovement.quantity).label('consumed')
+    used = select(StockMovement.filament_id, consumed).where(
+        StockMovement.reason == 'consume', StockMovement.created_at >= since
+    ).group_by(StockMovement.filament_id).order_by(consumed.desc()).limit(limit).subquery()
+
+    rows = (await db.execute(
+        select(used.c.filament_id, Manufacturer.name, Filament.type, Filament.color_name, used.c.consumed)
+        .join(Filament, Filament.id == used.c.filament_id)
+        .join(Manufacturer, Filament.manufacturer_id == Manufacturer.id)
+        .order_by(used.c.consumed.desc(), used.c.filament_id)
+    )).all()
+    if not rows:
+        return []
+    in_stock = dict((await db.execute(
+        select(stock.c.filament_id, func.sum(stock.c.quantity))
+        .where(stock.c.filament_id.in_([row.filament_id for row in rows]))
+        .group_by(stock.c.filament_id)
+    )).all())
+
+    report = []
+    for filament_id, manufacturer, filament_type, color_name, spools in rows:
+        per_day = spools / days
+        remaining = in_stock.get(filament_id) or 0
+        report.append({
+            'filament_id': filament_id,
+            'manufacturer': manufacturer,
+            'type': filament_type,
+            'color_name': color_name,
+            'consumed': spools,
+            'per_day': round(per_day, 3),
+            'in_stock': remaining,
+            'days_left': round(remaining / per_day, 1) if per_day else None,
+        })
+    return report
+
+
+async def run(args) -> None:
+    async with SessionLocal() as db:
+        if args.command == 'compact':
+            folded = await compact(db)
+            await db.commit()
+            print(f"Compacted {folded} stock movements")
+        else:
+            print(json.dumps(await consumption(db, args.days, args.limit), indent=2))
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['compact', 'report'])
+    parser.add_argument('--days', type=int, default=30, help='report window')
+    parser.add_argument('--limit', type=int, default=20, help='filaments in the report')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Logging setup for the application.
+
+Request handlers only put records on an in-memory queue. A QueueListener
+thread does the formatting and the file and console I/O, so a slow disk
+never stalls the event loop. Settings come from the environment:
+
+    LOG_LEVEL         root level (default INFO)
+    LOG_FORMAT        json or text (default json)
+    LOG_FILE          rotated log file, empty to log to the console only
+                      (default app.log). A {pid} placeholder gives every
+                      uvicorn worker its own file, because size-based
+                      rotation is not safe with several processes writing
+                      the same file.
+    LOG_MAX_BYTES     rotate after this many bytes (default 10 MB)
+    LOG_BACKUP_COUNT  rotated files to keep (default 5)
+    LOG_SAMPLE_RATES  per-route sampling of INFO/DEBUG records, keyed by the
+                      handler function name, e.g.
+                      "select_color_get=0.1,select_filament=0.05".
+                      Warnings and errors are never sampled out.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
+from typing import Dict, Optional
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed with extra= and is emitted as a field
+RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'func': record.funcName,
+            'pid': record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class StructuredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener's handlers.
+
+    The stock prepare() renders the traceback into the message and clears
+    exc_info, so JsonFormatter could never emit it as a field. This keeps
+    the message as is and passes the traceback along as exc_text.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        # Tracebacks hold frames; only the text crosses to the writer thread
+        record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of INFO/DEBUG records from the configured routes."""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.funcName)
+        return rate is None or random.random() < rate
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, rate = item.partition('=')
+        rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+def configure_logging() -> QueueListener:
+    """Install the queue handler on the root logger and start the writer thread."""
+    level = os.getenv('LOG_LEVEL', 'INFO').upper()
+    log_format = os.getenv('LOG_FORMAT', 'json').lower()
+    log_file: Optional[str] = os.getenv('LOG_FILE', 'app.log')
+
+    formatter = JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        path = log_file.format(pid=os.getpid())
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        handlers.append(RotatingFileHandler(
+            path,
+            maxBytes=int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+            backupCount=int(os.getenv('LOG_BACKUP_COUNT', '5')),
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue = SimpleQueue()
+    queue_handler = StructuredQueueHandler(queue)
+    queue_handler.addFilter(SamplingFilter(parse_sample_rates(os.getenv('LOG_SAMPLE_RATES', ''))))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Flush whatever is still queued when the worker exits
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,159 @@
+"""Prometheus metrics for requests, SQL statements and the connection pool.
+
+With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty,
+writable directory before the workers start. Every worker then writes its
+samples there and /metrics aggregates all of them, whichever worker answers
+the scrape.
+"""
+import os
+from contextvars import ContextVar
+from time import perf_counter
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+REQUEST_LATENCY = Histogram(
+    'filamento_http_request_duration_seconds', 'HTTP request latency by route',
+    ['method', 'route']
+)
+REQUESTS = Counter(
+    'filamento_http_requests_total', 'HTTP requests by route and status code',
+    ['method', 'route', 'status']
+)
+REQUEST_QUERIES = Histogram(
+    'filamento_http_request_db_queries', 'SQL statements executed per HTTP request',
+    ['route'], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50)
+)
+SQL_LATENCY = Histogram(
+    'filamento_db_statement_duration_seconds', 'SQL statement latency by operation',
+    ['engine', 'operation'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+POOL_CHECKED_OUT = Gauge(
+    'filamento_db_pool_checked_out', 'Connections currently checked out of the pool',
+    ['engine'], multiprocess_mode='livesum'
+)
+POOL_OVERFLOW = Gauge(
+    'filamento_db_pool_overflow', 'Connections open beyond pool_size',
+    ['engine'], multiprocess_mode='livesum'
+)
+POOL_WAIT = Histogram(
+    'filamento_db_pool_wait_seconds', 'Time spent waiting for a pooled connection',
+    ['engine'], buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+)
+EVENT_SUBSCRIBERS = Gauge(
+    'filamento_event_subscribers', 'Clients connected to the live event stream',
+    multiprocess_mode='livesum'
+)
+
+SQL_OPERATIONS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'COPY', 'CREATE', 'BEGIN', 'COMMIT', 'ROLLBACK'}
+
+# Mutable per-request statement counter, set by MetricsMiddleware and bumped by the engine hooks
+_request_queries: ContextVar = ContextVar('request_queries', default=None)
+
+
+def route_label(scope) -> str:
+    """Route template (e.g. /select_location/{filament_id}) to keep label cardinality bounded."""
+    route = scope.get('route')
+    if route is not None:
+        return route.path
+    # Mounted apps such as /static expose their mount point as root_path
+    return scope.get('root_path') or 'unmatched'
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency, status and SQL count per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        queries = [0]
+        token = _request_queries.set(queries)
+        start = perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = perf_counter() - start
+            _request_queries.reset(token)
+            route = route_label(scope)
+            REQUEST_LATENCY.labels(scope['method'], route).observe(elapsed)
+            REQUESTS.labels(scope['method'], route, str(status)).inc()
+            REQUEST_QUERIES.labels(route).observe(queries[0])
+
+
+def instrument_engine(engine: AsyncEngine, name: str = 'primary') -> None:
+    """Time every statement and track pool usage for an engine."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(perf_counter())
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = perf_counter() - conn.info['query_start'].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+        SQL_LATENCY.labels(name, operation if operation in SQL_OPERATIONS else 'OTHER').observe(elapsed)
+        queries = _request_queries.get()
+        if queries is not None:
+            queries[0] += 1
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('query_start'):
+            conn.info['query_start'].pop()
+
+    pool = sync_engine.pool
+
+    def update_pool_gauges(*args):
+        # NullPool (e.g. behind PgBouncer) keeps no counts
+        if hasattr(pool, 'checkedout'):
+            POOL_CHECKED_OUT.labels(name).set(pool.checkedout())
+            POOL_OVERFLOW.labels(name).set(max(0, pool.overflow()))
+
+    event.listen(pool, 'checkout', update_pool_gauges)
+    event.listen(pool, 'checkin', update_pool_gauges)
+
+    connect = pool.connect
+
+    def timed_connect():
+        start = perf_counter()
+        try:
+            return connect()
+        finally:
+            POOL_WAIT.labels(name).observe(perf_counter() - start)
+
+    pool.connect = timed_connect
+
+
+def render_metrics() -> bytes:
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
+
+
+def mark_worker_dead() -> None:
+    """Drop this worker's live gauges from the shared directory on shutdown."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(os.getpid())
+
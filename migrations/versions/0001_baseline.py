@@ -0,0 +1,75 @@
+"""Baseline schema
+
+Creates the tables that used to be created by Base.metadata.create_all at
+startup. Tables that already exist (databases created before migrations
+were introduced) are left untouched, so this revision can be applied to
+both new and existing installs.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 16:00:00
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Offline (--sql) runs cannot inspect the database and emit the full schema
+    existing = set() if context.is_offline_mode() else set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'manufacturer' not in existing:
+        op.create_table(
+            'manufacturer',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('name', sa.String(length=100), nullable=True),
+        )
+        op.create_index('ix_manufacturer_id', 'manufacturer', ['id'])
+        op.create_index('ix_manufacturer_name', 'manufacturer', ['name'], unique=True)
+
+    if 'filament' not in existing:
+        op.create_table(
+            'filament',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('manufacturer_id', sa.Integer(), sa.ForeignKey('manufacturer.id'), nullable=True),
+            sa.Column('type', sa.String(), nullable=True),
+            sa.Column('color_name', sa.String(), nullable=True),
+            sa.Column('color_hex_code', sa.String(), nullable=True),
+        )
+        op.create_index('ix_filament_id', 'filament', ['id'])
+
+    if 'inventory' not in existing:
+        op.create_table(
+            'inventory',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('filament_id', sa.Integer(), sa.ForeignKey('filament.id'), nullable=True),
+            sa.Column('location', sa.String(), nullable=True),
+            sa.Column('quantity', sa.Integer(), nullable=True),
+        )
+        op.create_index('ix_inventory_id', 'inventory', ['id'])
+
+    if 'data_version' not in existing:
+        op.create_table(
+            'data_version',
+            sa.Column('name', sa.String(length=50), primary_key=True),
+            sa.Column('version', sa.BigInteger(), nullable=False),
+        )
+
+    op.execute(
+        "INSERT INTO data_version (name, version) "
+        "SELECT 'catalog', 0 WHERE NOT EXISTS (SELECT 1 FROM data_version WHERE name = 'catalog')"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('data_version')
+    op.drop_table('inventory')
+    op.drop_table('filament')
+    op.drop_table('manufacturer')
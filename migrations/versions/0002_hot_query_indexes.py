@@ -0,0 +1,60 @@
+"""Composite indexes for the hot catalog and inventory queries
+
+- filament (manufacturer_id, type, color_name), unique: the duplicate check
+  in manage_filaments_post/manage_colors_post; its (manufacturer_id, type)
+  prefix also serves the type and color lookups of the selection wizard.
+- inventory (filament_id, location): the stock-in lookup in
+  select_location_post.
+- inventory (location): the occupancy GROUP BY in select_location_get.
+
+Duplicate filaments are merged into the lowest id before the unique index
+is created, with their inventory rows repointed to the surviving filament.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 16:05:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+SAME_FILAMENT = (
+    "d.manufacturer_id = f.manufacturer_id AND d.type = f.type AND d.color_name = f.color_name"
+)
+
+
+def upgrade() -> None:
+    op.execute(
+        "UPDATE inventory SET filament_id = ("
+        "  SELECT MIN(d.id) FROM filament f JOIN filament d ON " + SAME_FILAMENT +
+        "  WHERE f.id = inventory.filament_id"
+        ") WHERE filament_id IN ("
+        "  SELECT f.id FROM filament f WHERE EXISTS (SELECT 1 FROM filament d WHERE " + SAME_FILAMENT + " AND d.id < f.id)"
+        ")"
+    )
+    op.execute(
+        "DELETE FROM filament WHERE EXISTS ("
+        "  SELECT 1 FROM filament d WHERE d.manufacturer_id = filament.manufacturer_id"
+        "  AND d.type = filament.type AND d.color_name = filament.color_name AND d.id < filament.id"
+        ")"
+    )
+
+    op.create_index(
+        'uq_filament_manufacturer_type_color', 'filament',
+        ['manufacturer_id', 'type', 'color_name'], unique=True
+    )
+    op.create_index('ix_inventory_filament_location', 'inventory', ['filament_id', 'location'])
+    op.create_index('ix_inventory_location', 'inventory', ['location'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_inventory_location', table_name='inventory')
+    op.drop_index('ix_inventory_filament_location', table_name='inventory')
+    op.drop_index('uq_filament_manufacturer_type_color', table_name='filament')
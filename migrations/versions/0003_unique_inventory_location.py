@@ -0,0 +1,46 @@
+"""Unique inventory row per filament and location
+
+Stock-in is an INSERT ... ON CONFLICT (filament_id, location) upsert, which
+needs a unique index to conflict on. Rows duplicated by the old
+read-then-insert code are merged first: the lowest id keeps the summed
+quantity and the others are deleted.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 16:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "UPDATE inventory SET quantity = ("
+        "  SELECT SUM(d.quantity) FROM inventory d"
+        "  WHERE d.filament_id = inventory.filament_id AND d.location = inventory.location"
+        ") WHERE id IN ("
+        "  SELECT MIN(id) FROM inventory GROUP BY filament_id, location HAVING COUNT(*) > 1"
+        ")"
+    )
+    op.execute(
+        "DELETE FROM inventory WHERE EXISTS ("
+        "  SELECT 1 FROM inventory d WHERE d.filament_id = inventory.filament_id"
+        "  AND d.location = inventory.location AND d.id < inventory.id"
+        ")"
+    )
+
+    op.drop_index('ix_inventory_filament_location', table_name='inventory')
+    op.create_index('uq_inventory_filament_location', 'inventory', ['filament_id', 'location'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_inventory_filament_location', table_name='inventory')
+    op.create_index('ix_inventory_filament_location', 'inventory', ['filament_id', 'location'])
@@ -0,0 +1,33 @@
+"""Inventory data version
+
+Adds an 'inventory' row to data_version. Ledger compaction and occupancy
+rebuilds bump it (stock writes only append to the ledger, see 0007), and
+the inventory pages derive their ETag from it together with the ledger
+tail, so a conditional GET can answer 304 without running the inventory
+join.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 17:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "INSERT INTO data_version (name, version) "
+        "SELECT 'inventory', 0 WHERE NOT EXISTS (SELECT 1 FROM data_version WHERE name = 'inventory')"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM data_version WHERE name = 'inventory'")
@@ -0,0 +1,36 @@
+"""Shelf occupancy summary
+
+Spools per location, maintained by every stock write so the location
+picker reads at most 32 rows instead of aggregating the whole inventory.
+Backfilled from the current inventory.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 17:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'shelf_occupancy',
+        sa.Column('location', sa.String(), primary_key=True),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+    )
+    op.execute(
+        "INSERT INTO shelf_occupancy (location, quantity) "
+        "SELECT location, COALESCE(SUM(quantity), 0) FROM inventory WHERE location IS NOT NULL GROUP BY location"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('shelf_occupancy')
@@ -0,0 +1,42 @@
+"""Trigram indexes for typeahead search
+
+Enables pg_trgm and indexes manufacturer.name, filament.type and
+filament.color_name with gin_trgm_ops, which serve both the ILIKE
+'%term%' and the fuzzy `term <% column` conditions of /api/search.
+PostgreSQL only; other backends search an in-memory index (see search.py).
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 18:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+TRIGRAM_INDEXES = [
+    ('ix_manufacturer_name_trgm', 'manufacturer', 'name'),
+    ('ix_filament_type_trgm', 'filament', 'type'),
+    ('ix_filament_color_name_trgm', 'filament', 'color_name'),
+]
+
+
+def upgrade() -> None:
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table, column in TRIGRAM_INDEXES:
+        op.create_index(name, table, [column], postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    for name, table, _ in TRIGRAM_INDEXES:
+        op.drop_index(name, table_name=table)
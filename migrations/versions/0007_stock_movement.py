@@ -0,0 +1,55 @@
+"""Stock movement ledger
+
+Stock changes are appended to stock_movement instead of updating inventory
+rows in place; ledger compaction folds them into inventory and
+shelf_occupancy, which become the snapshot. Every existing inventory row
+gets an already-compacted 'opening' movement so the ledger history adds up
+to the current quantities.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 18:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'stock_movement',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), primary_key=True),
+        sa.Column('filament_id', sa.Integer(), sa.ForeignKey('filament.id'), nullable=False),
+        sa.Column('location', sa.String(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('reason', sa.String(20), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column('compacted', sa.Boolean(), nullable=False, server_default=sa.false()),
+    )
+    op.create_index('ix_stock_movement_tail', 'stock_movement', ['id'],
+                    postgresql_where=sa.text('NOT compacted'), sqlite_where=sa.text('compacted = 0'))
+    op.create_index('ix_stock_movement_created_at', 'stock_movement', ['created_at'])
+    op.create_index('ix_stock_movement_filament', 'stock_movement', ['filament_id', 'id'])
+    inventory = sa.table('inventory', sa.column('filament_id'), sa.column('location'), sa.column('quantity'))
+    movement = sa.table('stock_movement', sa.column('filament_id'), sa.column('location'), sa.column('quantity'),
+                        sa.column('reason'), sa.column('compacted'))
+    op.execute(movement.insert().from_select(
+        ['filament_id', 'location', 'quantity', 'reason', 'compacted'],
+        sa.select(inventory.c.filament_id, inventory.c.location, inventory.c.quantity, sa.literal('opening'), sa.true())
+        .where(inventory.c.filament_id.isnot(None), inventory.c.location.isnot(None), inventory.c.quantity != 0)
+    ))
+
+
+def downgrade() -> None:
+    # Movements that were never compacted are lost; run `python ledger.py compact` before downgrading
+    op.drop_index('ix_stock_movement_filament', table_name='stock_movement')
+    op.drop_index('ix_stock_movement_created_at', table_name='stock_movement')
+    op.drop_index('ix_stock_movement_tail', table_name='stock_movement')
+    op.drop_table('stock_movement')
@@ -0,0 +1,50 @@
+"""Indexes for keyset pagination of /api/inventory
+
+/api/inventory sorts on coalesce(<column>, '') followed by ids (see
+INVENTORY_SORT_KEYS in app.py). These expression indexes match those
+keys, so a page is read in index order and stops after `limit` rows
+instead of sorting the whole inventory join. filament (manufacturer_id, id)
+and inventory (filament_id, id) keep the rows under one manufacturer or
+filament in key order when the page is driven from the parent table.
+The partial index on the ledger tail by (filament_id, location) answers
+"has this row pending movements" for snapshot rows whose own quantity
+is 0.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 20:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+SORT_INDEXES = [
+    ('ix_manufacturer_name_sort', 'manufacturer', 'name'),
+    ('ix_filament_type_sort', 'filament', 'type'),
+    ('ix_filament_color_name_sort', 'filament', 'color_name'),
+    ('ix_inventory_location_sort', 'inventory', 'location'),
+]
+
+
+def upgrade() -> None:
+    for name, table, column in SORT_INDEXES:
+        op.create_index(name, table, [sa.text(f"coalesce({column}, '')"), 'id'])
+    op.create_index('ix_filament_manufacturer_id', 'filament', ['manufacturer_id', 'id'])
+    op.create_index('ix_inventory_filament_id', 'inventory', ['filament_id', 'id'])
+    op.create_index('ix_stock_movement_pending', 'stock_movement', ['filament_id', 'location'],
+                    postgresql_where=sa.text('NOT compacted'), sqlite_where=sa.text('compacted = 0'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_stock_movement_pending', table_name='stock_movement')
+    op.drop_index('ix_inventory_filament_id', table_name='inventory')
+    op.drop_index('ix_filament_manufacturer_id', table_name='filament')
+    for name, table, _ in SORT_INDEXES:
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,105 @@
+"""Shelf occupancy summary.
+
+shelf_occupancy holds the number of spools per location in the inventory
+snapshot. Ledger compaction updates it in the same transaction as the
+snapshot, and readers add the un-compacted tail, so the shelf map comes
+from at most 32 rows plus the tail instead of aggregating the inventory.
+
+Anything that changes inventory.quantity outside compaction (manual SQL,
+restores) makes the summary drift. Check and repair it with:
+
+    python occupancy.py verify     # exits 1 and lists locations that differ
+    python occupancy.py rebuild    # recompute the summary from inventory
+"""
+import argparse
+import asyncio
+import json
+import sys
+from typing import Dict
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import engine, SessionLocal, Inventory, ShelfOccupancy
+from catalog_cache import INVENTORY, bump_version
+from events import publish, reset_event
+from ledger import tail_occupancy
+
+
+async def stored_occupancy(db: AsyncSession) -> Dict[str, int]:
+    """Spools per location in the snapshot, from the summary table."""
+    rows = (await db.execute(select(ShelfOccupancy.location, ShelfOccupancy.quantity))).all()
+    return {location: quantity for location, quantity in rows if quantity}
+
+
+async def get_occupancy(db: AsyncSession) -> Dict[str, int]:
+    """Current spools per location: the summary plus the ledger tail."""
+    occupancy = await stored_occupancy(db)
+    for location, quantity in (await tail_occupancy(db)).items():
+        occupancy[location] = occupancy.get(location, 0) + quantity
+    return {location: quantity for location, quantity in occupancy.items() if quantity}
+
+
+async def compute_occupancy(db: AsyncSession) -> Dict[str, int]:
+    """Spools per location in the snapshot, aggregated from inventory (the slow path)."""
+    rows = (await db.execute(
+        select(Inventory.location, func.coalesce(func.sum(Inventory.quantity), 0))
+        .where(Inventory.location.isnot(None))
+        .group_by(Inventory.location)
+    )).all()
+    return {location: quantity for location, quantity in rows if quantity}
+
+
+async def occupancy_drift(db: AsyncSession) -> Dict[str, dict]:
+    """Locations where the summary disagrees with inventory."""
+    stored, actual = await stored_occupancy(db), await compute_occupancy(db)
+    return {
+        location: {'stored': stored.get(location, 0), 'actual': actual.get(location, 0)}
+        for location in sorted(stored.keys() | actual.keys())
+        if stored.get(location, 0) != actual.get(location, 0)
+    }
+
+
+async def rebuild_occupancy(db: AsyncSession) -> int:
+    """Replace the summary with a fresh aggregate; the caller commits. Returns the row count."""
+    conn = await db.connection()
+    if conn.dialect.name == 'postgresql':
+        # Only ledger compaction writes the summary. One that has not reached its
+        # occupancy update yet waits for this lock and adds its delta to the rebuilt
+        # totals; one that already has is waited for, and its inventory is counted
+        await conn.execute(text("LOCK TABLE shelf_occupancy IN EXCLUSIVE MODE"))
+    actual = await compute_occupancy(db)
+    await db.execute(delete(ShelfOccupancy))
+    if actual:
+        await db.execute(insert(ShelfOccupancy), [
+            {'location': location, 'quantity': quantity} for location, quantity in sorted(actual.items())
+        ])
+    await bump_version(db, INVENTORY)
+    await publish(db, reset_event())
+    return len(actual)
+
+
+async def run(command: str) -> int:
+    async with SessionLocal() as db:
+        if command == 'verify':
+            drift = await occupancy_drift(db)
+            print(json.dumps(drift, indent=2))
+            status = 1 if drift else 0
+        else:
+            rows = await rebuild_occupancy(db)
+            await db.commit()
+            print(f"Rebuilt shelf occupancy: {rows} locations")
+            status = 0
+    await engine.dispose()
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['verify', 'rebuild'])
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.command)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""Typeahead search over manufacturer names, filament types and color names.
+
+Every word of the query has to match one of the three fields, either as a
+word prefix ("pru" finds "Prusament") or fuzzily ("prsa" finds "Prusa").
+Results are ranked by how well the words matched and come with their
+stock locations.
+
+On PostgreSQL with the pg_trgm extension (migration 0006 creates it and
+the trigram indexes) ranking and matching happen in a single query. On
+other backends an in-memory index of the catalog is used instead. It is
+rebuilt whenever the catalog version changes, and the stock locations
+come from one query on the matched ids.
+"""
+import heapq
+import operator
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from functools import reduce
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, func, intersect, literal, or_, select, text, union
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from catalog_cache import CatalogCache
+from database import Manufacturer, Filament
+from ledger import stock
+
+SEARCH_FIELDS = (Manufacturer.name, Filament.type, Filament.color_name)
+FUZZY_THRESHOLD = 0.4
+FUZZY_MIN_LENGTH = 3
+MAX_TERMS = 5
+
+index_cache = CatalogCache(maxsize=1)
+_has_trigram: Optional[bool] = None
+
+
+def query_terms(query: str) -> List[str]:
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def trigrams(word: str) -> set:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def escape_like(term: str) -> str:
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class SearchIndex:
+    """Word index over the catalog: sorted words for prefix lookups, trigrams for fuzzy ones."""
+
+    def __init__(self, rows):
+        self.filaments = {row[0]: tuple(row) for row in rows}
+        postings = defaultdict(set)
+        for filament_id, manufacturer, filament_type, color_name, _ in self.filaments.values():
+            for field in (manufacturer, filament_type, color_name):
+                for word in query_terms(field or ''):
+                    postings[word].add(filament_id)
+        self.postings = dict(postings)
+        self.words = sorted(postings)
+        self.word_trigrams = {word: trigrams(word) for word in self.words if len(word) >= FUZZY_MIN_LENGTH}
+
+    def term_scores(self, term: str) -> Dict[int, float]:
+        scores = {}
+
+        def add(words, score):
+            for word in words:
+                for filament_id in self.postings[word]:
+                    if scores.get(filament_id, 0) < score:
+                        scores[filament_id] = score
+
+        i = bisect_left(self.words, term)
+        prefixed = []
+        while i < len(self.words) and self.words[i].startswith(term):
+            prefixed.append(self.words[i])
+            i += 1
+        add([term] if term in self.postings else [], 1.0)
+        add([word for word in prefixed if word != term], 0.9)
+
+        if len(term) >= FUZZY_MIN_LENGTH:
+            term_trigrams = trigrams(term)
+            for word, word_trigrams in self.word_trigrams.items():
+                similarity = len(term_trigrams & word_trigrams) / len(term_trigrams | word_trigrams)
+                if similarity >= FUZZY_THRESHOLD:
+                    add([word], 0.8 * similarity)
+        return scores
+
+    def search(self, terms: List[str], limit: int) -> List[tuple]:
+        """[(filament row, score)], best first; every term must match."""
+        totals = None
+        for term in terms:
+            scores = self.term_scores(term)
+            totals = scores if totals is None else {
+                filament_id: total + scores[filament_id] for filament_id, total in totals.items() if filament_id in scores
+            }
+            if not totals:
+                return []
+        ranked = heapq.nsmallest(limit, totals.items(), key=lambda item: (
+            -item[1], *(field or '' for field in self.filaments[item[0]][1:4])
+        ))
+        return [(self.filaments[filament_id], score) for filament_id, score in ranked]
+
+
+async def get_index(db: AsyncSession) -> SearchIndex:
+    async def load():
+        rows = (await db.execute(
+            select(Filament.id, Manufacturer.name, Filament.type, Filament.color_name, Filament.color_hex_code)
+            .join(Manufacturer, Filament.manufacturer_id == Manufacturer.id)
+        )).all()
+        return SearchIndex(rows)
+    return await index_cache.get(db, ('search_index',), load)
+
+
+async def has_trigram(db: AsyncSession) -> bool:
+    """Whether the database can run the pg_trgm query; checked once per process."""
+    global _has_trigram
+    if _has_trigram is None:
+        conn = await db.connection()
+        _has_trigram = conn.dialect.name == 'postgresql' and bool((await conn.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        )).scalar())
+    return _has_trigram
+
+
+def trigram_query(terms: List[str], limit: int):
+    """Ranked filaments joined to their inventory rows, in one statement."""
+    def field_score(term, column):
+        pattern = escape_like(term)
+        return case(
+            (func.lower(column).like(f'{pattern}%', escape='\\'), 1.0),
+            (func.lower(column).like(f'% {pattern}%', escape='\\'), 0.9),
+            else_=0.8 * func.word_similarity(term, column),
+        )
+
+    def matches(term, column):
+        # Both forms can use the column's gin_trgm_ops index
+        return or_(column.ilike(f'%{escape_like(term)}%', escape='\\'), literal(term).op('<%')(column))
+
+    def term_ids(term):
+        # One branch per table: an OR spanning manufacturer and filament could not use either index
+        return union(
+            select(Filament.id).where(or_(matches(term, Filament.type), matches(term, Filament.color_name))),
+            select(Filament.id).join(Manufacturer, Filament.manufacturer_id == Manufacturer.id)
+            .where(matches(term, Manufacturer.name)),
+        )
+
+    matched = (intersect(*map(term_ids, terms)) if len(terms) > 1 else term_ids(terms[0])).subquery('matched')
+    score = reduce(operator.add, (
+        func.greatest(*(field_score(term, column) for column in SEARCH_FIELDS)) for term in terms
+    )).label('score')
+    ranked = select(
+        Filament.id.label('filament_id'),
+        Manufacturer.name.label('manufacturer'),
+        Filament.type,
+        Filament.color_name,
+        Filament.color_hex_code,
+        score,
+    ).select_from(matched
+    ).join(Filament, Filament.id == matched.c.id
+    ).join(Manufacturer, Filament.manufacturer_id == Manufacturer.id
+    ).order_by(score.desc(), Manufacturer.name, Filament.type, Filament.color_name
+    ).limit(limit).subquery()
+
+    return select(ranked, stock.c.location, stock.c.quantity).outerjoin(
+        stock, stock.c.filament_id == ranked.c.filament_id
+    ).order_by(ranked.c.score.desc(), ranked.c.manufacturer, ranked.c.type, ranked.c.color_name, stock.c.location)
+
+
+def result(row, score) -> dict:
+    filament_id, manufacturer, filament_type, color_name, color_hex_code = row
+    return {
+        'filament_id': filament_id,
+        'manufacturer': manufacturer,
+        'type': filament_type,
+        'color_name': color_name,
+        'color_hex_code': color_hex_code,
+        'score': round(float(score), 3),
+        'quantity': 0,
+        'locations': [],
+    }
+
+
+def add_location(entry: dict, location: Optional[str], quantity: Optional[int]) -> None:
+    if location is not None and quantity:
+        entry['locations'].append({'location': location, 'quantity': quantity})
+        entry['quantity'] += quantity
+
+
+async def search_filaments(db: AsyncSession, query: str, limit: int = 20) -> List[dict]:
+    terms = query_terms(query)
+    if not terms:
+        return []
+
+    results = {}
+    if await has_trigram(db):
+        for row in (await db.execute(trigram_query(terms, limit))).all():
+            entry = results.setdefault(row.filament_id, result(row[:5], row.score))
+            add_location(entry, row.location, row.quantity)
+        return list(results.values())
+
+    index = await get_index(db)
+    for row, score in index.search(terms, limit):
+        results[row[0]] = result(row, score)
+    if results:
+        locations = (await db.execute(
+            select(stock.c.filament_id, stock.c.location, stock.c.quantity)
+            .where(stock.c.filament_id.in_(list(results)))
+            .order_by(stock.c.location)
+        )).all()
+        for filament_id, location, quantity in locations:
+            add_location(results[filament_id], location, quantity)
+    return list(results.values())
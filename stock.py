@@ -0,0 +1,94 @@
+from collections import defaultdict
+from typing import Iterable, Tuple
+
+from sqlalchemy import insert, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import Inventory, StockMovement, upsert
+from events import publish, stock_event
+from ledger import stock
+
+
+class InsufficientStock(ValueError):
+    """Raised when more spools are taken from a location than it holds."""
+
+
+def merge_stock(items: Iterable[Tuple[int, str, int]]) -> list:
+    """Sum quantities per (filament_id, location).
+
+    The result is sorted so that concurrent batches touch rows in the same
+    order and cannot deadlock.
+    """
+    totals = defaultdict(int)
+    for filament_id, location, quantity in items:
+        totals[(filament_id, location)] += quantity
+    return [
+        {'filament_id': filament_id, 'location': location, 'quantity': quantity}
+        for (filament_id, location), quantity in sorted(totals.items())
+    ]
+
+
+async def record_movements(db: AsyncSession, rows: list, reason: str) -> None:
+    """Append merged rows to the stock ledger and announce them once the caller commits."""
+    await db.execute(insert(StockMovement), [dict(row, reason=reason) for row in rows])
+    await publish(db, stock_event(rows))
+
+
+async def add_stock(db: AsyncSession, items: Iterable[Tuple[int, str, int]]) -> list:
+    """Stock in (filament_id, location, quantity) tuples; the caller commits.
+
+    Only inserts: a ledger row per merged pair, plus an empty snapshot row
+    the first time a filament is stored at a location. ON CONFLICT DO
+    NOTHING takes no row lock, so writes to the same spool do not queue
+    behind each other. Returns the merged rows.
+    """
+    rows = merge_stock(items)
+    if not rows:
+        return rows
+    stmt = upsert(db, Inventory).values([dict(row, quantity=0) for row in rows])
+    await db.execute(stmt.on_conflict_do_nothing(index_elements=[Inventory.filament_id, Inventory.location]))
+    await record_movements(db, rows, 'stock_in')
+    return rows
+
+
+async def lock_stock(db: AsyncSession, rows: list) -> None:
+    """Hold the snapshot rows of the merged rows until the caller commits.
+
+    Consumers of the same (filament_id, location) queue here, so each one
+    checks the quantity only after the previous one has committed. Rows come
+    sorted from merge_stock, so two batches cannot deadlock.
+    """
+    keys = tuple_(Inventory.filament_id, Inventory.location).in_([(row['filament_id'], row['location']) for row in rows])
+    if db.get_bind().dialect.name == 'sqlite':
+        # No row locks in SQLite, and pysqlite only begins a transaction on a write:
+        # a no-op UPDATE takes the database write lock before the check is read
+        await db.execute(update(Inventory).where(keys).values(quantity=Inventory.quantity))
+    else:
+        await db.execute(
+            select(Inventory.id).where(keys).order_by(Inventory.filament_id, Inventory.location).with_for_update()
+        )
+
+
+async def consume_stock(db: AsyncSession, items: Iterable[Tuple[int, str, int]]) -> list:
+    """Take (filament_id, location, quantity) tuples out of stock; the caller commits.
+
+    Raises InsufficientStock if a location holds fewer spools than asked.
+    Returns the merged rows with negative quantities.
+    """
+    rows = merge_stock(items)
+    if not rows:
+        return rows
+    await lock_stock(db, rows)
+    available = dict(((filament_id, location), quantity) for filament_id, location, quantity in (await db.execute(
+        select(stock.c.filament_id, stock.c.location, stock.c.quantity)
+        .where(tuple_(stock.c.filament_id, stock.c.location).in_([(row['filament_id'], row['location']) for row in rows]))
+    )).all())
+    for row in rows:
+        if available.get((row['filament_id'], row['location']), 0) < row['quantity']:
+            raise InsufficientStock(
+                f"Only {available.get((row['filament_id'], row['location']), 0)} spools of filament "
+                f"{row['filament_id']} at {row['location']}"
+            )
+    rows = [dict(row, quantity=-row['quantity']) for row in rows]
+    await record_movements(db, rows, 'consume')
+    return rows
@@ -0,0 +1,54 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from assets import AssetManifest, accepted_encodings, build_assets
+
+
+class TestAssets(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.static = self.tmp.name
+        with open(os.path.join(self.static, 'style.css'), 'w') as f:
+            f.write('body { color: red; }\n' * 50)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_build_fingerprints_and_precompresses(self):
+        manifest = AssetManifest(build_assets(self.static))
+        hashed = manifest.resolve('style.css')
+        self.assertRegex(hashed, r'^build/style\.[0-9a-f]{12}\.css$')
+        self.assertIn('gzip', manifest.encodings[hashed])
+        with gzip.open(os.path.join(self.static, hashed + '.gz'), 'rt') as f:
+            self.assertTrue(f.read().startswith('body'))
+        self.assertEqual(AssetManifest.load(self.static, build=False).resolve('style.css'), hashed)
+
+    def test_content_change_changes_name(self):
+        first = AssetManifest(build_assets(self.static)).resolve('style.css')
+        with open(os.path.join(self.static, 'style.css'), 'a') as f:
+            f.write('a { color: blue; }\n')
+        self.assertNotEqual(AssetManifest(build_assets(self.static)).resolve('style.css'), first)
+
+    def test_load_rebuilds_stale_manifest(self):
+        first = AssetManifest.load(self.static).resolve('style.css')
+        self.assertEqual(AssetManifest.load(self.static).resolve('style.css'), first)
+        source = os.path.join(self.static, 'style.css')
+        with open(source, 'a') as f:
+            f.write('a { color: blue; }\n')
+        os.utime(source, ns=(0, os.stat(source).st_mtime_ns + 1))
+        self.assertEqual(AssetManifest.load(self.static, build=False).resolve('style.css'), first)
+        self.assertNotEqual(AssetManifest.load(self.static).resolve('style.css'), first)
+
+    def test_unknown_paths_resolve_to_themselves(self):
+        self.assertEqual(AssetManifest().resolve('missing.png'), 'missing.png')
+
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings('gzip, deflate, br'), {'gzip', 'deflate', 'br'})
+        self.assertEqual(accepted_encodings('br;q=0, gzip;q=0.5'), {'gzip'})
+
+
+if __name__ == '__main__':
+    unittest.main()
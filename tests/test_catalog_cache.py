@@ -0,0 +1,39 @@
+import unittest
+from unittest.mock import patch, AsyncMock
+
+from catalog_cache import CatalogCache
+
+
+class TestCatalogCache(unittest.IsolatedAsyncioTestCase):
+
+    async def test_hit_does_not_reload(self):
+        cache = CatalogCache(maxsize=4)
+        loader = AsyncMock(return_value=['PLA'])
+        with patch('catalog_cache.get_version', AsyncMock(return_value=1)):
+            self.assertEqual(await cache.get(None, ('types', 1), loader), ['PLA'])
+            self.assertEqual(await cache.get(None, ('types', 1), loader), ['PLA'])
+        self.assertEqual(loader.await_count, 1)
+
+    async def test_version_change_invalidates(self):
+        cache = CatalogCache(maxsize=4)
+        loader = AsyncMock(side_effect=[['PLA'], ['PLA', 'PETG']])
+        with patch('catalog_cache.get_version', AsyncMock(side_effect=[1, 2])):
+            await cache.get(None, ('types', 1), loader)
+            self.assertEqual(await cache.get(None, ('types', 1), loader), ['PLA', 'PETG'])
+        self.assertEqual(cache.version, 2)
+
+    async def test_lru_eviction(self):
+        cache = CatalogCache(maxsize=2)
+        with patch('catalog_cache.get_version', AsyncMock(return_value=1)):
+            await cache.get(None, 'a', AsyncMock(return_value=1))
+            await cache.get(None, 'b', AsyncMock(return_value=2))
+            await cache.get(None, 'a', AsyncMock())
+            await cache.get(None, 'c', AsyncMock(return_value=3))
+            reload_b = AsyncMock(return_value=2)
+            await cache.get(None, 'b', reload_b)
+        self.assertEqual(len(cache), 2)
+        reload_b.assert_awaited_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
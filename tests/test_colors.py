@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+
+from colors import ColorIndex, parse_hex, rgb_to_lab
+
+
+class TestColors(unittest.TestCase):
+
+    def test_parse_hex(self):
+        self.assertEqual(parse_hex('#FF8000'), (255, 128, 0))
+        self.assertEqual(parse_hex('ff8000'), (255, 128, 0))
+        self.assertEqual(parse_hex('#F80'), (255, 136, 0))
+        self.assertIsNone(parse_hex('#GG0000'))
+        self.assertIsNone(parse_hex(None))
+
+    def test_rgb_to_lab(self):
+        lab = rgb_to_lab([(255, 255, 255), (0, 0, 0), (255, 0, 0)])
+        np.testing.assert_allclose(lab, [(100, 0, 0), (0, 0, 0), (53.24, 80.09, 67.20)], atol=0.01)
+
+    def test_nearest(self):
+        index = ColorIndex()
+        index.add([(1, '#FF0000'), (2, '#0000FF'), (3, '#E01010'), (4, None), (5, '#000000')])
+        self.assertEqual((len(index), index.rows_seen, index.max_id), (4, 5, 5))
+
+        ids, distances = index.nearest((250, 0, 0), 2)
+        self.assertEqual(ids.tolist(), [1, 3])
+        self.assertLess(distances[0], distances[1])
+        self.assertEqual(index.nearest((0, 0, 0))[0].tolist(), [5, 3, 1, 2])
+
+    def test_nearest_within_mask(self):
+        index = ColorIndex()
+        index.add([(1, '#FF0000'), (2, '#0000FF'), (3, '#E01010'), (4, '#000000')])
+        ids, _ = index.nearest((250, 0, 0), 2, mask=np.isin(index.ids, [2, 4]))
+        self.assertEqual(ids.tolist(), [4, 2])
+        self.assertEqual(len(index.nearest((250, 0, 0), 2, mask=np.zeros(len(index), dtype=bool))[0]), 0)
+
+    def test_add_skips_loaded_rows(self):
+        index = ColorIndex()
+        index.add([(1, '#FF0000'), (2, '#0000FF')])
+        index.add([(2, '#0000FF'), (3, '#00FF00')])
+        self.assertEqual(index.ids.tolist(), [1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import asyncio
+import json
+import unittest
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from database import create_engine
+from events import MAX_PAYLOAD, Broadcaster, broadcaster, encode, notify, publish, stock_event
+
+
+class TestEvents(unittest.TestCase):
+
+    def test_stock_event(self):
+        rows = [{'filament_id': 1, 'location': '1-LF', 'quantity': 2}, {'filament_id': 2, 'location': '1-LF', 'quantity': 1}]
+        self.assertEqual(stock_event(rows)['occupancy'], {'1-LF': 3})
+
+    def test_encode_drops_rows_from_large_events(self):
+        rows = [{'filament_id': i, 'location': '1-LF', 'quantity': 1} for i in range(1000)]
+        payload = encode(stock_event(rows))
+        self.assertLess(len(payload), MAX_PAYLOAD)
+        self.assertEqual(json.loads(payload), {'type': 'stock', 'rows': None, 'occupancy': {'1-LF': 1000}})
+
+    def test_encode_resets_when_occupancy_is_too_large(self):
+        rows = [{'filament_id': 1, 'location': f"location-{i}", 'quantity': 1} for i in range(1000)]
+        self.assertEqual(json.loads(encode(stock_event(rows))), {'type': 'reset'})
+
+    def test_slow_subscriber_gets_reset(self):
+        async def run():
+            target = Broadcaster(queue_size=2)
+            queue = target.subscribe()
+            for i in range(3):
+                target.publish({'type': 'stock', 'n': i})
+            events = [queue.get_nowait() for _ in range(queue.qsize())]
+            target.unsubscribe(queue)
+            return events, len(target)
+        self.assertEqual(asyncio.run(run()), ([{'type': 'reset'}], 0))
+
+    def test_published_after_commit_only(self):
+        async def run():
+            engine = create_engine('sqlite+aiosqlite://')
+            queue = broadcaster.subscribe()
+            try:
+                async with AsyncSession(engine) as db:
+                    await db.execute(text('SELECT 1'))
+                    await publish(db, {'type': 'stock', 'n': 1})
+                    await db.rollback()
+                    await db.execute(text('SELECT 1'))
+                    await publish(db, {'type': 'stock', 'n': 2})
+                    self.assertTrue(queue.empty())
+                    await db.commit()
+                return [queue.get_nowait() for _ in range(queue.qsize())]
+            finally:
+                broadcaster.unsubscribe(queue)
+                await engine.dispose()
+        self.assertEqual(asyncio.run(run()), [{'type': 'stock', 'n': 2}])
+
+    def test_failed_notify_resets_local_clients(self):
+        async def run():
+            engine = create_async_engine('postgresql+asyncpg://filamento@127.0.0.1:1/filamento')
+            queue = broadcaster.subscribe()
+            try:
+                await notify(engine, [{'type': 'stock', 'n': 1}])
+                return [queue.get_nowait() for _ in range(queue.qsize())]
+            finally:
+                broadcaster.unsubscribe(queue)
+                await engine.dispose()
+        self.assertEqual(asyncio.run(run()), [{'type': 'reset'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
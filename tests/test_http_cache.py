@@ -0,0 +1,94 @@
+import gzip
+import unittest
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from http_cache import CompressionMiddleware, check_not_modified, make_etag, with_etag
+
+PAGE = '<html>' + 'spool ' * 1000 + '</html>'
+
+
+async def page(request):
+    etag = make_etag(request, 7)
+    return check_not_modified(request, etag) or with_etag(HTMLResponse(PAGE), etag)
+
+
+async def text(request):
+    return PlainTextResponse('x' * 5000)
+
+
+async def stream(request):
+    async def rows():
+        for i in range(3):
+            yield f'row,{i}\n' * 500
+    return StreamingResponse(rows(), media_type='text/csv')
+
+
+app = Starlette(routes=[Route('/page', page), Route('/text', text), Route('/stream', stream)])
+app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+
+class TestCompressionMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(app)
+
+    def raw_get(self, path, **headers):
+        # httpx decodes gzip transparently; read the wire bytes instead
+        with self.client.stream('GET', path, headers=headers) as response:
+            return response, b''.join(response.iter_raw())
+
+    def test_html_is_gzipped(self):
+        response, body = self.raw_get('/page', **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['content-encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['vary'])
+        self.assertEqual(gzip.decompress(body).decode(), PAGE)
+        self.assertEqual(int(response.headers['content-length']), len(body))
+
+    def test_identity_when_not_accepted(self):
+        response, body = self.raw_get('/page', **{'Accept-Encoding': 'identity'})
+        self.assertNotIn('content-encoding', response.headers)
+        self.assertEqual(body.decode(), PAGE)
+
+    def test_other_media_types_pass_through(self):
+        response, _ = self.raw_get('/text', **{'Accept-Encoding': 'gzip'})
+        self.assertNotIn('content-encoding', response.headers)
+
+    def test_streamed_body_is_gzipped(self):
+        response, body = self.raw_get('/stream', **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['content-encoding'], 'gzip')
+        self.assertNotIn('content-length', response.headers)
+        self.assertEqual(gzip.decompress(body).decode(), ''.join(f'row,{i}\n' * 500 for i in range(3)))
+
+
+class TestConditionalGet(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(app)
+
+    def test_matching_etag_returns_304(self):
+        etag = self.client.get('/page').headers['etag']
+        self.assertTrue(etag.startswith('W/"'))
+        response = self.client.get('/page', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response.headers['etag'], etag)
+
+    def test_etag_depends_on_query_string(self):
+        self.assertNotEqual(
+            self.client.get('/page?manufacturer_id=1').headers['etag'],
+            self.client.get('/page?manufacturer_id=2').headers['etag'],
+        )
+
+    def test_stale_etag_gets_full_response(self):
+        response = self.client.get('/page', headers={'If-None-Match': 'W/"stale", "other"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, PAGE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from import_data import ImportFormatError, csv_records, json_records, split_csv_header
+
+
+async def chunked(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+class TestImportParsing(unittest.IsolatedAsyncioTestCase):
+
+    async def test_csv_header_is_split_from_body(self):
+        data = b'Manufacturer,type,color_name\nPrusa,PLA,Red\nPrusa,PETG,Blue\n'
+        columns, body = await split_csv_header(chunked(data))
+        self.assertEqual(columns, ['manufacturer', 'type', 'color_name'])
+        self.assertEqual(b''.join([chunk async for chunk in body]), b'Prusa,PLA,Red\nPrusa,PETG,Blue\n')
+
+    async def test_csv_rejects_unknown_and_missing_columns(self):
+        with self.assertRaises(ImportFormatError):
+            await split_csv_header(chunked(b'manufacturer,type,color_name,weight\n'))
+        with self.assertRaises(ImportFormatError):
+            await split_csv_header(chunked(b'manufacturer,type\n'))
+
+    async def test_csv_records_with_quoted_newlines_across_chunks(self):
+        body = 'Prusa,"PLA\nMatte",Red\nBambu,PETG,"Blue, ""Dark"""\nPrusa,,Green\n'.encode()
+        records = [record async for record in csv_records(['manufacturer', 'type', 'color_name'], chunked(body, 5))]
+        self.assertEqual(records, [
+            ('Prusa', 'PLA\nMatte', 'Red', None),
+            ('Bambu', 'PETG', 'Blue, "Dark"', None),
+            ('Prusa', None, 'Green', None),
+        ])
+
+    async def test_json_lines_across_chunk_boundaries(self):
+        data = (
+            b'{"manufacturer": "Prusa", "type": "PLA", "color_name": "Red", "color_hex_code": "#FF0000"}\n'
+            b'\n'
+            b'{"manufacturer": "Bambu", "type": "PETG", "color_name": "Blue"}'
+        )
+        records = [record async for record in json_records(chunked(data))]
+        self.assertEqual(records, [
+            ('Prusa', 'PLA', 'Red', '#FF0000'),
+            ('Bambu', 'PETG', 'Blue', None),
+        ])
+
+    async def test_json_rejects_invalid_lines(self):
+        with self.assertRaises(ImportFormatError):
+            [record async for record in json_records(chunked(b'not json\n'))]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+import logging
+import unittest
+from queue import SimpleQueue
+from unittest.mock import patch
+
+from logging_config import JsonFormatter, SamplingFilter, StructuredQueueHandler, parse_sample_rates
+
+
+def make_record(func, level=logging.INFO, **extra):
+    record = logging.LogRecord('app', level, 'app.py', 1, 'Found %d colors', (3,), None, func=func)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestLoggingConfig(unittest.TestCase):
+
+    def test_parse_sample_rates(self):
+        self.assertEqual(parse_sample_rates('select_color_get=0.1, select_filament=2'),
+                         {'select_color_get': 0.1, 'select_filament': 1.0})
+        self.assertEqual(parse_sample_rates(''), {})
+
+    def test_sampling_only_applies_to_configured_routes_below_warning(self):
+        sampling = SamplingFilter({'select_color_get': 0.0})
+        self.assertFalse(sampling.filter(make_record('select_color_get')))
+        self.assertTrue(sampling.filter(make_record('select_color_get', logging.ERROR)))
+        self.assertTrue(sampling.filter(make_record('view_inventory')))
+        with patch('logging_config.random.random', return_value=0.05):
+            self.assertTrue(SamplingFilter({'select_color_get': 0.1}).filter(make_record('select_color_get')))
+
+    def test_json_formatter_includes_extra_fields(self):
+        entry = json.loads(JsonFormatter().format(make_record('select_color_get', count=3)))
+        self.assertEqual(entry['message'], 'Found 3 colors')
+        self.assertEqual(entry['func'], 'select_color_get')
+        self.assertEqual(entry['count'], 3)
+
+    def test_exception_survives_the_queue(self):
+        queue = SimpleQueue()
+        logger = logging.getLogger('test_logging_config')
+        logger.addHandler(StructuredQueueHandler(queue))
+        logger.propagate = False
+        try:
+            try:
+                1 / 0
+            except ZeroDivisionError:
+                logger.exception('Division failed')
+        finally:
+            logger.handlers.clear()
+            logger.propagate = True
+        record = queue.get_nowait()
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry['message'], 'Division failed')
+        self.assertIn('ZeroDivisionError', entry['exc'])
+        self.assertIn('ZeroDivisionError', logging.Formatter().format(record))
+
+
+if __name__ == '__main__':
+    unittest.main()
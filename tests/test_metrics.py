@@ -0,0 +1,32 @@
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from metrics import MetricsMiddleware, render_metrics
+
+
+class TestMetricsMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware)
+
+        @app.get('/spools/{spool_id}')
+        async def spool(spool_id: int):
+            return {'id': spool_id}
+
+        self.client = TestClient(app)
+
+    def test_requests_are_labelled_by_route_template(self):
+        self.client.get('/spools/1')
+        self.client.get('/spools/2')
+        self.client.get('/missing')
+        output = render_metrics().decode()
+        self.assertIn('filamento_http_requests_total{method="GET",route="/spools/{spool_id}",status="200"}', output)
+        self.assertIn('filamento_http_requests_total{method="GET",route="unmatched",status="404"}', output)
+        self.assertNotIn('route="/spools/1"', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
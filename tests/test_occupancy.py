@@ -0,0 +1,83 @@
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import occupancy
+from database import create_engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestOccupancy(unittest.TestCase):
+    """verify/rebuild against a migrated SQLite database whose summary has drifted."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        url = f"sqlite+aiosqlite:///{os.path.join(self.tmpdir, 'test.db')}"
+        config = Config(os.path.join(ROOT, 'alembic.ini'))
+        config.set_main_option('script_location', os.path.join(ROOT, 'migrations'))
+        config.set_main_option('sqlalchemy.url', url)
+        command.upgrade(config, 'head')
+        self.url = url
+        self.execute(
+            "INSERT INTO manufacturer (id, name) VALUES (1, 'Manufacturer1')",
+            "INSERT INTO filament (id, manufacturer_id, type, color_name, color_hex_code) VALUES "
+            "(1, 1, 'PLA', 'Red', '#FF0000'), (2, 1, 'PLA', 'Blue', '#0000FF')",
+            # Inventory changed by hand: the summary is missing 1-LF and still counts an emptied 2-RB
+            "INSERT INTO inventory (filament_id, location, quantity) VALUES (1, '1-LF', 2), (2, '1-LF', 1), (2, '2-RB', 0)",
+            "INSERT INTO shelf_occupancy (location, quantity) VALUES ('2-RB', 4)",
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def execute(self, *statements):
+        async def run():
+            engine = create_engine(self.url)
+            async with engine.begin() as conn:
+                for statement in statements:
+                    await conn.execute(text(statement))
+            await engine.dispose()
+        asyncio.run(run())
+
+    def cli(self, command_name):
+        """Run the occupancy.py command against the test database; returns (status, stdout)."""
+        async def run():
+            engine = create_engine(self.url)
+            sessions = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+            with patch.object(occupancy, 'engine', engine), patch.object(occupancy, 'SessionLocal', sessions):
+                return await occupancy.run(command_name)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            status = asyncio.run(run())
+        return status, output.getvalue()
+
+    def test_verify_reports_drift_and_rebuild_repairs_it(self):
+        status, output = self.cli('verify')
+        self.assertEqual(status, 1)
+        self.assertEqual(json.loads(output), {
+            '1-LF': {'stored': 0, 'actual': 3},
+            '2-RB': {'stored': 4, 'actual': 0},
+        })
+
+        status, output = self.cli('rebuild')
+        self.assertEqual(status, 0)
+        self.assertIn('1 locations', output)
+
+        status, output = self.cli('verify')
+        self.assertEqual((status, json.loads(output)), (0, {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,89 +1,289 @@
+import asyncio
+import os
+import shutil
+import tempfile
 import unittest
-from app import app, get_db_connection
-from unittest.mock import patch, MagicMock
+
+os.environ.setdefault('LOG_FILE', '')
+
+from alembic import command
+from alembic.config import Config
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app import app, catalog_cache
+from colors import color_index
+from database import create_engine, get_db, get_read_db
+from ledger import compact
+from stock import InsufficientStock, consume_stock
+from search import index_cache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 
 class TestRoutes(unittest.TestCase):
+    """Routes against a migrated SQLite database, one fresh database per test."""
 
     def setUp(self):
-        self.app = app.test_client()
-        self.app.testing = True
+        self.tmpdir = tempfile.mkdtemp()
+        url = f"sqlite+aiosqlite:///{os.path.join(self.tmpdir, 'test.db')}"
+        config = Config(os.path.join(ROOT, 'alembic.ini'))
+        config.set_main_option('script_location', os.path.join(ROOT, 'migrations'))
+        config.set_main_option('sqlalchemy.url', url)
+        command.upgrade(config, 'head')
 
-    @patch('app.get_db_connection')
-    def test_index(self, mock_db_conn):
-        response = self.app.get('/')
-        self.assertEqual(response.status_code, 200)
+        self.engine = create_engine(url)
+        sessions = async_sessionmaker(bind=self.engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
-    @patch('app.get_db_connection')
-    def test_select_manufacturer(self, mock_db_conn):
-        mock_cursor = MagicMock()
-        mock_cursor.fetchall.return_value = [(1, 'Manufacturer1'), (2, 'Manufacturer2')]
-        mock_db_conn.return_value.cursor.return_value = mock_cursor
+        async def get_test_db():
+            async with sessions() as db:
+                yield db
 
-        response = self.app.get('/select_manufacturer')
-        self.assertEqual(response.status_code, 200)
-        self.assertIn(b'Manufacturer1', response.data)
-        self.assertIn(b'Manufacturer2', response.data)
+        app.dependency_overrides[get_db] = get_test_db
+        app.dependency_overrides[get_read_db] = get_test_db
+        catalog_cache.clear()
+        index_cache.clear()
+        color_index.clear()
+        self.execute(
+            "INSERT INTO manufacturer (id, name) VALUES (1, 'Manufacturer1'), (2, 'Manufacturer2')",
+            "INSERT INTO filament (id, manufacturer_id, type, color_name, color_hex_code) VALUES "
+            "(1, 1, 'PLA', 'Red', '#FF0000'), (2, 1, 'PLA', 'Blue', '#0000FF'), (3, 1, 'ABS', 'Black', '#000000')",
+        )
+        self.client = TestClient(app)
 
-    @patch('app.get_db_connection')
-    def test_select_filament_type(self, mock_db_conn):
-        mock_cursor = MagicMock()
-        mock_cursor.fetchall.return_value = [('PLA',), ('ABS',)]
-        mock_db_conn.return_value.cursor.return_value = mock_cursor
+    def tearDown(self):
+        app.dependency_overrides.clear()
+        asyncio.run(self.engine.dispose())
+        shutil.rmtree(self.tmpdir)
 
-        response = self.app.get('/select_filament_type/1')
-        self.assertEqual(response.status_code, 200)
-        self.assertIn(b'PLA', response.data)
-        self.assertIn(b'ABS', response.data)
+    def compact(self):
+        async def run():
+            async with AsyncSession(self.engine) as db:
+                folded = await compact(db)
+                await db.commit()
+                return folded
+        return asyncio.run(run())
 
-    @patch('app.get_db_connection')
-    def test_select_color(self, mock_db_conn):
-        mock_cursor = MagicMock()
-        mock_cursor.fetchall.return_value = [('Red', '#FF0000'), ('Blue', '#0000FF')]
-        mock_db_conn.return_value.cursor.return_value = mock_cursor
+    def execute(self, *statements):
+        async def run():
+            async with self.engine.begin() as conn:
+                for statement in statements:
+                    await conn.execute(text(statement))
+        asyncio.run(run())
 
-        response = self.app.get('/select_color?manufacturer_id=1&filament_type=PLA')
+    def test_index(self):
+        response = self.client.get('/')
         self.assertEqual(response.status_code, 200)
-        self.assertIn(b'Red', response.data)
-        self.assertIn(b'Blue', response.data)
 
-    def test_select_shelf(self):
-        response = self.app.get('/select_shelf?manufacturer_id=1&filament_type=PLA&color_name=Red&color_hex_code=%23FF0000')
+    def test_select_manufacturer(self):
+        response = self.client.get('/select_manufacturer')
         self.assertEqual(response.status_code, 200)
-        self.assertIn(b'Select Shelf', response.data)
+        self.assertIn('Manufacturer1', response.text)
+        self.assertIn('Manufacturer2', response.text)
 
-    def test_select_position(self):
-        response = self.app.get('/select_position/1/PLA/Red/%23FF0000/1')
+    def test_select_filament_type(self):
+        response = self.client.get('/select_filament/1')
         self.assertEqual(response.status_code, 200)
-        self.assertIn(b'Select Position', response.data)
-
-    @patch('app.get_db_connection')
-    def test_add_inventory(self, mock_db_conn):
-        mock_cursor = MagicMock()
-        mock_db_conn.return_value.cursor.return_value = mock_cursor
-
-        response = self.app.post('/add_inventory', data={
-            'manufacturer_id': '1',
-            'filament_type': 'PLA',
-            'color_name': 'Red',
-            'color_hex_code': '#FF0000',
-            'location': 'Shelf 1 Left Front'
-        }, follow_redirects=True)
-        
+        self.assertIn('PLA', response.text)
+        self.assertIn('ABS', response.text)
+
+    def test_catalog_tree(self):
+        response = self.client.get('/api/catalog/1')
+        self.assertEqual(response.json(), {'id': 1, 'name': 'Manufacturer1', 'types': {
+            'ABS': [[3, 'Black', '#000000']],
+            'PLA': [[2, 'Blue', '#0000FF'], [1, 'Red', '#FF0000']],
+        }})
+        cached = self.client.get('/api/catalog/1', headers={'If-None-Match': response.headers['etag']})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.client.get('/api/catalog/2').json()['types'], {})
+        self.assertEqual(self.client.get('/api/catalog/9').status_code, 404)
+
+    def test_select_color(self):
+        response = self.client.get('/select_color?manufacturer_id=1&filament_type=PLA')
         self.assertEqual(response.status_code, 200)
-        self.assertIn(b'Success', response.data)
+        self.assertIn('Red', response.text)
+        self.assertIn('Blue', response.text)
+        self.assertNotIn('Black', response.text)
+
+    def test_add_inventory(self):
+        for quantity in (1, 2):
+            response = self.client.post('/select_location/1', data={'location': '1-LF', 'quantity': quantity},
+                                        follow_redirects=False)
+            self.assertEqual(response.status_code, 303)
+        response = self.client.post('/api/inventory/batch', json={'items': [
+            {'filament_id': 2, 'location': '1-LF'}, {'filament_id': 1, 'location': '3-RB', 'quantity': 4},
+        ]})
+        self.assertEqual(response.json(), {'rows': 2, 'spools': 5})
+        response = self.client.post('/api/inventory/batch', json={'items': [{'filament_id': 1, 'location': 'attic'}]})
+        self.assertEqual(response.status_code, 422)
+
+        rows = self.client.get('/api/inventory?sort=location').json()['data']
+        self.assertEqual([(r['color_name'], r['location'], r['quantity']) for r in rows],
+                         [('Red', '1-LF', 3), ('Blue', '1-LF', 1), ('Red', '3-RB', 4)])
+        shelves = self.client.get('/api/shelves').json()
+        self.assertEqual((shelves['1-LF'], shelves['3-RB'], shelves['2-LB']), (4, 4, 0))
+
+    def test_inventory_pages_include_null_sort_keys(self):
+        self.execute(
+            "INSERT INTO filament (id, manufacturer_id, type, color_name, color_hex_code) VALUES "
+            "(4, 1, NULL, 'Grey', '#808080'), (5, 1, NULL, 'White', '#FFFFFF')"
+        )
+        for filament_id in (1, 4, 5, 2):
+            self.client.post(f'/select_location/{filament_id}', data={'location': '1-LF', 'quantity': 1})
+        seen, cursor = [], None
+        while True:
+            params = {'sort': 'type', 'limit': 1}
+            if cursor:
+                params['cursor'] = cursor
+            page = self.client.get('/api/inventory', params=params).json()
+            seen += [row['color_name'] for row in page['data']]
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, ['Grey', 'White', 'Red', 'Blue'])
+
+    def test_batch_merges_duplicates_and_adds_to_existing_rows(self):
+        item = {'filament_id': 1, 'location': '1-LF', 'quantity': 2}
+        response = self.client.post('/api/inventory/batch', json={'items': [item, item, dict(item, filament_id=2)]})
+        self.assertEqual(response.json(), {'rows': 2, 'spools': 6})
+        # The same pairs again hit the unique (filament_id, location) rows: ON CONFLICT, not a second row
+        self.client.post('/api/inventory/batch', json={'items': [item]})
+        self.compact()
+        self.client.post('/api/inventory/batch', json={'items': [item]})
+        self.assertEqual(self.compact(), 1)
+
+        async def snapshot():
+            async with AsyncSession(self.engine) as db:
+                return (await db.execute(text(
+                    "SELECT filament_id, location, quantity FROM inventory ORDER BY filament_id"
+                ))).all()
+        self.assertEqual([tuple(row) for row in asyncio.run(snapshot())], [(1, '1-LF', 8), (2, '1-LF', 2)])
+
+    def test_select_location_rejects_invalid_stock_in(self):
+        for data in ({'location': '1-LF', 'quantity': 0}, {'location': '1-LF', 'quantity': -2},
+                     {'location': 'attic', 'quantity': 1}):
+            with self.subTest(**data):
+                response = self.client.post('/select_location/1', data=data, follow_redirects=False)
+                self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.client.get('/api/inventory/history/1').json()['movements'], [])
+
+    def test_stock_write_changes_etag_without_version_row(self):
+        async def inventory_version():
+            async with AsyncSession(self.engine) as db:
+                return (await db.execute(text("SELECT version FROM data_version WHERE name = 'inventory'"))).scalar()
 
-    @patch('app.get_db_connection')
-    def test_view_inventory(self, mock_db_conn):
-        mock_cursor = MagicMock()
-        mock_cursor.fetchall.return_value = [('Manufacturer1', 'PLA', 'Red', '#FF0000', 'Shelf 1 Left Front')]
-        mock_db_conn.return_value.cursor.return_value = mock_cursor
+        before = self.client.get('/api/inventory')
+        self.client.post('/select_location/1', data={'location': '1-LF', 'quantity': 1})
+        after = self.client.get('/api/inventory', headers={'If-None-Match': before.headers['etag']})
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after.headers['etag'], before.headers['etag'])
+        # No hot-row UPDATE per stock write: only compaction moves the counter
+        self.assertEqual(asyncio.run(inventory_version()), 0)
 
-        response = self.app.get('/view_inventory')
+    def test_inventory_pages_skip_emptied_rows(self):
+        for filament_id, location in ((1, '1-LF'), (2, '2-LF'), (3, '3-LF'), (1, '4-LF')):
+            self.client.post(f'/select_location/{filament_id}', data={'location': location, 'quantity': 1})
+        self.compact()
+        self.client.post('/api/inventory/consume', json={'items': [{'filament_id': 2, 'location': '2-LF'}]})
+        for order, expected in (('asc', ['1-LF', '3-LF', '4-LF']), ('desc', ['4-LF', '3-LF', '1-LF'])):
+            seen, cursor = [], None
+            while True:
+                params = {'sort': 'location', 'order': order, 'limit': 1}
+                if cursor:
+                    params['cursor'] = cursor
+                page = self.client.get('/api/inventory', params=params).json()
+                seen += [row['location'] for row in page['data']]
+                cursor = page['next_cursor']
+                if not cursor:
+                    break
+            self.assertEqual(seen, expected)
+        self.assertEqual(self.client.get('/api/inventory', params={'cursor': 'bogus'}).status_code, 400)
+
+    def test_consume_and_compact(self):
+        self.client.post('/api/inventory/batch', json={'items': [{'filament_id': 1, 'location': '1-LF', 'quantity': 3}]})
+        response = self.client.post('/api/inventory/consume', json={'items': [{'filament_id': 1, 'location': '1-LF', 'quantity': 4}]})
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post('/api/inventory/consume', json={'items': [{'filament_id': 1, 'location': '1-LF', 'quantity': 2}]})
+        self.assertEqual(response.json(), {'rows': 1, 'spools': 2})
+        self.assertEqual([r['quantity'] for r in self.client.get('/api/inventory').json()['data']], [1])
+
+        before = self.client.get('/api/shelves')
+        self.assertEqual(self.compact(), 2)
+        self.assertEqual(self.compact(), 0)
+        after = self.client.get('/api/shelves', headers={'If-None-Match': before.headers['etag']})
+        self.assertEqual((after.status_code, after.json()['1-LF']), (200, 1))
+        self.assertEqual([r['quantity'] for r in self.client.get('/api/inventory').json()['data']], [1])
+
+        movements = self.client.get('/api/inventory/history/1').json()['movements']
+        self.assertEqual([(m['reason'], m['quantity']) for m in movements], [('consume', -2), ('stock_in', 3)])
+        report = self.client.get('/api/reports/consumption').json()['filaments']
+        self.assertEqual([(r['filament_id'], r['consumed'], r['in_stock']) for r in report], [(1, 2, 1)])
+
+    def test_concurrent_consume(self):
+        self.client.post('/api/inventory/batch', json={'items': [{'filament_id': 1, 'location': '1-LF', 'quantity': 2}]})
+
+        async def consume():
+            async with AsyncSession(self.engine) as db:
+                try:
+                    await consume_stock(db, [(1, '1-LF', 2)])
+                except InsufficientStock:
+                    return False
+                # Hold the transaction open so the other consumer runs its check meanwhile
+                await asyncio.sleep(0.2)
+                await db.commit()
+                return True
+
+        async def run():
+            return await asyncio.gather(consume(), consume())
+
+        self.assertEqual(sorted(asyncio.run(run())), [False, True])
+        self.assertEqual([r['quantity'] for r in self.client.get('/api/inventory').json()['data']], [])
+
+    def test_select_location(self):
+        self.execute("INSERT INTO shelf_occupancy (location, quantity) VALUES ('1-LF', 3)")
+        response = self.client.get('/select_location/1')
         self.assertEqual(response.status_code, 200)
-        self.assertIn(b'Manufacturer1', response.data)
-        self.assertIn(b'PLA', response.data)
-        self.assertIn(b'Red', response.data)
-        self.assertIn(b'Shelf 1 Left Front', response.data)
+        self.assertIn('title="3 spools"', response.text)
+
+    def test_view_inventory(self):
+        self.client.post('/select_location/1', data={'location': '1-LF', 'quantity': 1})
+        response = self.client.get('/view_inventory')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Manufacturer1', response.text)
+        self.assertIn('PLA', response.text)
+        self.assertIn('Red', response.text)
+
+        page = self.client.get('/api/inventory', params={'manufacturer': 'Manufacturer1'}).json()
+        self.assertEqual(page['data'][0]['location'], '1-LF')
+        self.assertIsNone(page['next_cursor'])
+
+    def test_search(self):
+        self.client.post('/select_location/2', data={'location': '2-RB', 'quantity': 2})
+        results = self.client.get('/api/search', params={'q': 'manufacturer1 blu'}).json()['results']
+        self.assertEqual([(r['filament_id'], r['quantity']) for r in results], [(2, 2)])
+        self.assertEqual(results[0]['locations'], [{'location': '2-RB', 'quantity': 2}])
+        self.assertEqual(self.client.get('/api/search', params={'q': ''}).json()['results'], [])
+
+    def test_nearest_colors(self):
+        self.client.post('/select_location/2', data={'location': '2-RB', 'quantity': 1})
+        results = self.client.get('/api/colors/nearest', params={'hex': '#200000', 'k': 2, 'in_stock': 'false'}).json()['results']
+        self.assertEqual([r['filament_id'] for r in results], [3, 1])
+        results = self.client.get('/api/colors/nearest', params={'hex': 'f00'}).json()['results']
+        self.assertEqual([(r['filament_id'], r['locations']) for r in results], [(2, [{'location': '2-RB', 'quantity': 1}])])
+
+        self.client.post('/manage_filaments', data={
+            'manufacturer_id': 1, 'filament_type': 'PLA', 'color_name': 'Dark Red', 'color_hex_code': '#220000'})
+        results = self.client.get('/api/colors/nearest', params={'hex': '#200000', 'k': 1, 'in_stock': 'false'}).json()['results']
+        self.assertEqual(results[0]['color_name'], 'Dark Red')
+        self.assertEqual(self.client.get('/api/colors/nearest', params={'hex': 'red'}).status_code, 400)
+
+    def test_catalog_import(self):
+        data = b'manufacturer,type,color_name,color_hex_code\nManufacturer1,PLA,Red,#FF0000\nNew,"PETG\nHF",Green,\n'
+        response = self.client.post('/api/catalog/import', files={'file': ('catalog.csv', data)})
+        self.assertEqual(response.json(), {'rows': 2, 'manufacturers_added': 1, 'filaments_added': 1})
+        self.assertIn('New', self.client.get('/select_manufacturer').text)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+from search import SearchIndex, query_terms
+
+CATALOG = [
+    (1, 'Prusament', 'PLA', 'Galaxy Black', '#111111'),
+    (2, 'Prusament', 'PETG', 'Jet Black', '#000000'),
+    (3, 'Bambu Lab', 'PLA', 'Red', '#FF0000'),
+    (4, 'Polymaker', 'PLA', 'Black', '#000000'),
+    (5, 'Polymaker', 'ASA', None, None),
+]
+
+
+class TestSearchIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SearchIndex(CATALOG)
+
+    def ids(self, query, limit=10):
+        return [row[0] for row, _ in self.index.search(query_terms(query), limit)]
+
+    def test_word_prefix(self):
+        self.assertEqual(self.ids('prus'), [2, 1])
+        self.assertEqual(self.ids('lab'), [3])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.ids('pla black'), [4, 1])
+        self.assertEqual(self.ids('prusa red'), [])
+
+    def test_exact_word_ranks_above_prefix(self):
+        (_, exact), = self.index.search(['jet'], 10)
+        (_, prefix), = self.index.search(['je'], 10)
+        self.assertGreater(exact, prefix)
+
+    def test_fuzzy(self):
+        self.assertEqual(self.ids('polimaker'), [5, 4])
+        self.assertEqual(self.ids('galxy'), [1])
+
+    def test_limit(self):
+        self.assertEqual(len(self.ids('pla', limit=2)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,21 @@
+import unittest
+
+from stock import merge_stock
+
+
+class TestMergeStock(unittest.TestCase):
+
+    def test_duplicates_are_summed_and_sorted(self):
+        rows = merge_stock([(2, '1-LF', 1), (1, '3-RB', 2), (2, '1-LF', 3), (1, '1-LF', 1)])
+        self.assertEqual(rows, [
+            {'filament_id': 1, 'location': '1-LF', 'quantity': 1},
+            {'filament_id': 1, 'location': '3-RB', 'quantity': 2},
+            {'filament_id': 2, 'location': '1-LF', 'quantity': 4},
+        ])
+
+    def test_empty(self):
+        self.assertEqual(merge_stock([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()